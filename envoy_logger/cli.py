@@ -1,5 +1,6 @@
 import logging
 import os
+import signal
 from argparse import ArgumentParser, FileType, Namespace
 from typing import List, Optional
 
@@ -16,6 +17,15 @@ logging.basicConfig(
 LOG = logging.getLogger(__name__)
 
 
+def _exit_on_sigterm(signum, frame) -> None:
+    """
+    docker stop / systemd send SIGTERM. Only raise here: the handler runs on the
+    main thread, which may hold the scheduler Event's lock, so stop() could
+    deadlock. SystemExit unwinds run_aligned and queued points are still flushed.
+    """
+    raise SystemExit(0)
+
+
 def parse_args(argv: Optional[List[str]] = None) -> Namespace:
     parser = ArgumentParser()
 
@@ -42,35 +52,34 @@ def main(argv: Optional[List[str]] = None) -> None:
 
     envoy = Envoy(url=config.envoy_url, enphase_energy=enphase_energy)
 
-    # Log runtime parameters and env before starting the sampling loop
-    LOG.info("CLI args: config=%s", args.config.name)
-    LOG.info(
-        "Env: ENVOY_LOGGER_CFG_PATH=%s, LOG_LEVEL=%s",
-        os.environ.get("ENVOY_LOGGER_CFG_PATH", "(not set)"),
-        os.environ.get("LOG_LEVEL", "(not set)"),
-    )
+    # One INFO line with the runtime parameters; env and secret presence only at DEBUG
     LOG.info(
-        "Env (secrets): ENPHASE_EMAIL=%s, ENPHASE_PASSWORD=%s, INFLUXDB_TOKEN=%s",
-        "set" if os.environ.get("ENPHASE_EMAIL") else "not set",
-        "set" if os.environ.get("ENPHASE_PASSWORD") else "not set",
-        "set" if os.environ.get("INFLUXDB_TOKEN") else "not set",
-    )
-    LOG.info(
-        "Runtime: envoy_url=%s, envoy_serial=%s, source_tag=%s, "
-        "polling_interval=%ds, inverter_interval=%ds",
+        "Starting: config=%s, envoy_url=%s, envoy_serial=%s, source_tag=%s, "
+        "polling_interval=%ds, inverter_interval=%ds, influxdb_url=%s, org=%s, "
+        "bucket_hr=%s, bucket_lr=%s",
+        args.config.name,
         config.envoy_url,
         config.envoy_serial,
         config.source_tag,
         config.polling_interval,
         config.inverter_polling_interval,
-    )
-    LOG.info(
-        "InfluxDB: url=%s, org=%s, bucket_hr=%s, bucket_lr=%s",
         config.influxdb_url,
         config.influxdb_org,
         config.influxdb_bucket_hr,
         config.influxdb_bucket_lr,
     )
+    if LOG.isEnabledFor(logging.DEBUG):
+        env = os.environ
+        LOG.debug(
+            "Env: ENVOY_LOGGER_CFG_PATH=%s, LOG_LEVEL=%s, ENPHASE_EMAIL=%s, "
+            "ENPHASE_PASSWORD=%s, INFLUXDB_TOKEN=%s",
+            env.get("ENVOY_LOGGER_CFG_PATH", "(not set)"),
+            env.get("LOG_LEVEL", "(not set)"),
+            "set" if env.get("ENPHASE_EMAIL") else "not set",
+            "set" if env.get("ENPHASE_PASSWORD") else "not set",
+            "set" if env.get("INFLUXDB_TOKEN") else "not set",
+        )
 
     sampling_loop = InfluxdbSamplingEngine(envoy=envoy, config=config)
+    signal.signal(signal.SIGTERM, _exit_on_sigterm)
     sampling_loop.run()
@@ -4,7 +4,6 @@ import sys
 from typing import Any, Dict, Optional
 
 import yaml
-from influxdb_client import Point
 
 LOG = logging.getLogger("config")
 
@@ -61,9 +60,11 @@ class Config:
             LOG.error("Missing required config key: %s", e.args[0])
             sys.exit(1)
 
-    def apply_tags_to_inverter_point(self, p: Point, serial: str) -> None:
-        if serial in self.inverters.keys():
-            self.inverters[serial].apply_tags_to_point(p)
+    def get_inverter_tags(self, serial: str) -> Dict[str, str]:
+        inverter = self.inverters.get(serial)
+        if inverter is None:
+            return {}
+        return inverter.tags
 
 
 class InverterConfig:
@@ -71,10 +72,6 @@ class InverterConfig:
         self.serial = serial
         self.tags = data.get("tags", {})
 
-    def apply_tags_to_point(self, p: Point) -> None:
-        for k, v in self.tags.items():
-            p.tag(k, v)
-
 
 def load_config(path: str) -> Config:
     LOG.info("Loading config %s", path)
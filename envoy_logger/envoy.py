@@ -1,10 +1,12 @@
 import logging
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 from typing import Dict, Optional
 
 import requests
 import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 
 from envoy_logger.enphase_energy import EnphaseEnergy
 from envoy_logger.model import InverterSample, SampleData, parse_inverter_data
@@ -15,12 +17,37 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 LOG = logging.getLogger("envoy")
 
 
+def create_session() -> requests.Session:
+    """
+    HTTP session shared by all Envoy requests, so polls reuse pooled keep-alive
+    TLS connections. Transient gateway errors are retried with backoff; connect and
+    read timeouts are not, so a hung Envoy costs one 30s timeout, not four.
+    """
+    retry = Retry(
+        total=3,
+        connect=0,
+        read=0,
+        backoff_factor=0.5,
+        status_forcelist=[502, 503, 504],
+    )
+    adapter = HTTPAdapter(
+        pool_connections=4, pool_maxsize=8, pool_block=False, max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
 @dataclass
 class Envoy:
     url: str
     enphase_energy: EnphaseEnergy
     session_id: Optional[str] = None
     session_id_last_update: datetime = datetime.now()
+    session: requests.Session = field(
+        default_factory=create_session, repr=False, compare=False
+    )
 
     def get_session_id(self) -> str:
         now = datetime.now()
@@ -41,7 +68,7 @@ class Envoy:
             "Authorization": f"Bearer {enphase_token}",
         }
 
-        response = requests.get(
+        response = self.session.get(
             f"{self.url}/auth/check_jwt",
             headers=headers,
             verify=False,
@@ -58,7 +85,7 @@ class Envoy:
             "sessionId": self.get_session_id(),
         }
 
-        response = requests.get(
+        response = self.session.get(
             f"{self.url}/production.json?details=1",
             cookies=cookies,
             verify=False,
@@ -75,7 +102,7 @@ class Envoy:
             "sessionId": self.get_session_id(),
         }
 
-        response = requests.get(
+        response = self.session.get(
             f"{self.url}/api/v1/production/inverters",
             cookies=cookies,
             verify=False,
@@ -93,7 +120,7 @@ class Envoy:
             "sessionId": self.get_session_id(),
         }
 
-        response = requests.get(
+        response = self.session.get(
             f"{self.url}/inventory.json?deleted=1",
             cookies=cookies,
             verify=False,
@@ -1,13 +1,21 @@
 import logging
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime, timezone
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
-from influxdb_client import InfluxDBClient, Point, WritePrecision
-from influxdb_client.client.write_api import SYNCHRONOUS
+from influxdb_client import InfluxDBClient, WritePrecision
+from influxdb_client.client.write_api import SYNCHRONOUS, WriteOptions
 
 from envoy_logger.config import Config
 from envoy_logger.envoy import Envoy
+from envoy_logger.line_protocol import (
+    encode_fields,
+    field_value,
+    series_key,
+    timestamp_s,
+)
 from envoy_logger.model import (
     InverterSample,
     PowerSample,
@@ -18,6 +26,56 @@ from envoy_logger.sampling_engine import SamplingEngine
 
 LOG = logging.getLogger("influxdb_sampling_engine")
 
+# High-rate points are queued and flushed in the background so a poll cycle
+# never blocks on an InfluxDB round trip.
+HIGH_RATE_WRITE_OPTIONS = WriteOptions(
+    batch_size=500,
+    flush_interval=10_000,
+    jitter_interval=2_000,
+    retry_interval=5_000,
+    max_retries=5,
+    max_retry_delay=30_000,
+    exponential_base=2,
+)
+
+# The rollover worker waits this long before its Flux integral so points still
+# queued in the batching writer (up to flush_interval + jitter) reach bucket_hr.
+ROLLOVER_FLUSH_DELAY_S = (
+    HIGH_RATE_WRITE_OPTIONS.flush_interval + HIGH_RATE_WRITE_OPTIONS.jitter_interval
+) / 1000
+
+# Flux queries; {bucket} and {source} are filled in once per engine.
+LAST_INVERTER_TS_FLUX = """
+from(bucket: "{bucket}")
+    |> range(start: -30d)
+    |> filter(fn: (r) => r["source"] == "{source}")
+    |> filter(fn: (r) => r["measurement-type"] == "inverter")
+    |> group()
+    |> max(column: "_time")
+    |> yield(name: "max")
+"""
+
+# Both daily integrals in one request: power lines and inverters come back as
+# separate result tables, told apart by their measurement-type.
+DAILY_WH_FLUX = """
+data = from(bucket: "{bucket}")
+    |> range(start: -24h, stop: 0h)
+    |> filter(fn: (r) => r["source"] == "{source}")
+    |> filter(fn: (r) => r["_field"] == "P")
+
+data
+    |> filter(fn: (r) => r["measurement-type"] != "inverter")
+    |> integral(unit: 1h)
+    |> keep(columns: ["_value", "line-idx", "measurement-type"])
+    |> yield(name: "power")
+
+data
+    |> filter(fn: (r) => r["measurement-type"] == "inverter")
+    |> integral(unit: 1h)
+    |> keep(columns: ["_value", "serial", "measurement-type"])
+    |> yield(name: "inverter")
+"""
+
 
 class InfluxdbSamplingEngine(SamplingEngine):
     def __init__(self, envoy: Envoy, config: Config) -> None:
@@ -29,17 +87,52 @@ class InfluxdbSamplingEngine(SamplingEngine):
 
         self.config = config
 
-        influxdb_client = InfluxDBClient(
+        self.influxdb_client = InfluxDBClient(
             url=config.influxdb_url,
             token=config.influxdb_token,
             org=config.influxdb_org,
         )
 
-        self.influxdb_write_api = influxdb_client.write_api(write_options=SYNCHRONOUS)
-        self.influxdb_query_api = influxdb_client.query_api()
+        # Batched writer for high-rate points; blocking writer for the one-shot
+        # daily summaries so a failed rollover write surfaces immediately.
+        self.influxdb_write_api = self.influxdb_client.write_api(
+            write_options=HIGH_RATE_WRITE_OPTIONS,
+            error_callback=self._on_batch_write_error,
+        )
+        self.influxdb_daily_write_api = self.influxdb_client.write_api(
+            write_options=SYNCHRONOUS
+        )
+        self.influxdb_query_api = self.influxdb_client.query_api()
+
+        # Daily summaries run off the scheduler thread so a slow Flux integral
+        # never delays a poll. One worker keeps rollovers in order.
+        self._rollover_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="rollover"
+        )
+        # Set by close() to cut short a rollover's flush wait.
+        self._closing = threading.Event()
+
+        flux_args = {"bucket": config.influxdb_bucket_hr, "source": config.source_tag}
+        self._last_inverter_ts_query = LAST_INVERTER_TS_FLUX.format(**flux_args)
+        self._daily_query = DAILY_WH_FLUX.format(**flux_args)
+
+        self.todays_date: date = date.today()
 
-        self.power_todays_date: date = date.today()
-        self.inverter_todays_date: date = date.today()
+        # Latest inverter timestamp written to bucket_hr. Loaded from InfluxDB on
+        # the first inverter cycle, then maintained locally.
+        self._last_inverter_write_ts: Optional[datetime] = None
+        self._last_inverter_write_ts_loaded = False
+
+        # Escaped "measurement,tags" line prefixes, keyed by (measurement-type, line-idx)
+        # for power lines and by serial for inverters, for both high-rate and daily
+        # summary series. The tag sets never change.
+        self._power_series_keys: Dict[Tuple[str, int], str] = {}
+        self._inverter_series_keys: Dict[str, str] = {}
+        self._power_daily_series_keys: Dict[Tuple[str, str], str] = {}
+        self._inverter_daily_series_keys: Dict[str, str] = {}
+        for serial in config.inverters:
+            self._inverter_series_key(serial)
+            self._inverter_daily_series_key(serial)
 
     def run(self) -> None:
         LOG.info(
@@ -47,12 +140,34 @@ class InfluxdbSamplingEngine(SamplingEngine):
             self.interval_seconds,
             self.inverter_interval_seconds,
         )
-        power_thread = threading.Thread(target=self._power_loop, daemon=False)
-        inverter_thread = threading.Thread(target=self._inverter_loop, daemon=False)
-        power_thread.start()
-        inverter_thread.start()
-        power_thread.join()
-        inverter_thread.join()
+        try:
+            self.run_aligned(
+                [
+                    (self.interval_seconds, self._power_cycle),
+                    (self.inverter_interval_seconds, self._inverter_cycle),
+                ]
+            )
+        finally:
+            # stop(), Ctrl-C and SIGTERM (SystemExit) all end up here
+            self.close()
+
+    def close(self) -> None:
+        """Flush queued points, finish pending daily summaries, release the client."""
+        # Flushing first lets a pending summary skip its wait and still see every point
+        self.influxdb_write_api.close()
+        self._closing.set()
+        self._rollover_executor.shutdown(wait=True)
+        self.influxdb_client.close()
+
+    def _on_batch_write_error(
+        self, conf: Tuple[str, str, str], data: str, exception: Exception
+    ) -> None:
+        LOG.warning(
+            "Batched write to %s failed (%s): %s",
+            conf[0],
+            type(exception).__name__,
+            exception,
+        )
 
     def _sample_timestamp(self, sample_data: SampleData) -> datetime:
         """Return a timestamp from the first available power line sample, or now."""
@@ -65,47 +180,60 @@ class InfluxdbSamplingEngine(SamplingEngine):
                 return eim.eim_line_samples[0].ts
         return datetime.now(tz=timezone.utc)
 
-    def _power_loop(self) -> None:
-        while True:
-            self.wait_for_next_cycle(self.interval_seconds)
-            try:
-                power_data = self.get_power_data()
-                LOG.debug("Sampled power data:\n%s", power_data)
-                points = self._power_high_rate_points(power_data)
-                if points:
-                    self.influxdb_write_api.write(
-                        bucket=self.config.influxdb_bucket_hr, record=points
-                    )
-                ts = self._sample_timestamp(power_data)
-                self._power_day_rollover(ts)
-            except Exception as e:
-                LOG.warning(
-                    "Power poll failed (%s): %s. Skipping this cycle.",
-                    type(e).__name__,
-                    e,
+    def _power_cycle(self) -> None:
+        try:
+            power_data = self.get_power_data()
+            LOG.debug("Sampled power data:\n%s", power_data)
+            points = self._power_high_rate_points(power_data)
+            if points:
+                self.influxdb_write_api.write(
+                    bucket=self.config.influxdb_bucket_hr,
+                    record=points,
+                    write_precision=WritePrecision.S,
                 )
+            self._day_rollover(self._sample_timestamp(power_data))
+        except Exception as e:
+            LOG.warning(
+                "Power poll failed (%s): %s. Skipping this cycle.",
+                type(e).__name__,
+                e,
+            )
 
-    def _inverter_loop(self) -> None:
-        while True:
-            self.wait_for_next_cycle(self.inverter_interval_seconds)
-            try:
-                cutoff_ts = self._query_last_inverter_timestamp()
-                raw_inverter_data = self.get_inverter_data()
-                inverter_data = filter_new_inverter_data(raw_inverter_data, cutoff_ts)
-                self.last_inverter_poll = datetime.now(tz=timezone.utc)
-                LOG.debug("Sampled inverter data (filtered):\n%s", inverter_data)
-                points = self._inverter_high_rate_points(inverter_data)
-                if points:
-                    self.influxdb_write_api.write(
-                        bucket=self.config.influxdb_bucket_hr, record=points
-                    )
-                self._inverter_day_rollover()
-            except Exception as e:
-                LOG.warning(
-                    "Inverter poll failed (%s): %s. Skipping this cycle (no write).",
-                    type(e).__name__,
-                    e,
+    def _inverter_cycle(self) -> None:
+        try:
+            cutoff_ts = self._last_inverter_timestamp()
+            inverter_data = filter_new_inverter_data(
+                self.get_inverter_data(), cutoff_ts
+            )
+            self.last_inverter_poll = time.monotonic()
+            LOG.debug("Sampled inverter data (filtered):\n%s", inverter_data)
+            points = self._inverter_high_rate_points(inverter_data)
+            if points:
+                self.influxdb_write_api.write(
+                    bucket=self.config.influxdb_bucket_hr,
+                    record=points,
+                    write_precision=WritePrecision.S,
                 )
+                self._last_inverter_write_ts = max(
+                    inv.ts for inv in inverter_data.values()
+                )
+            self._day_rollover()
+        except Exception as e:
+            LOG.warning(
+                "Inverter poll failed (%s): %s. Skipping this cycle (no write).",
+                type(e).__name__,
+                e,
+            )
+
+    def _last_inverter_timestamp(self) -> Optional[datetime]:
+        """
+        Return the cached latest inverter write time, querying bucket_hr only until
+        the first successful query. Query failures propagate so the cycle is skipped.
+        """
+        if not self._last_inverter_write_ts_loaded:
+            self._last_inverter_write_ts = self._query_last_inverter_timestamp()
+            self._last_inverter_write_ts_loaded = True
+        return self._last_inverter_write_ts
 
     def _query_last_inverter_timestamp(self) -> Optional[datetime]:
         """
@@ -113,164 +241,178 @@ class InfluxdbSamplingEngine(SamplingEngine):
         Returns None only when the query succeeds and there are no inverter points yet (e.g. first run).
         Raises on query failure so the caller can skip the write and avoid duplicates.
         """
-        query = f"""
-        from(bucket: "{self.config.influxdb_bucket_hr}")
-            |> range(start: -30d)
-            |> filter(fn: (r) => r["source"] == "{self.config.source_tag}")
-            |> filter(fn: (r) => r["measurement-type"] == "inverter")
-            |> group()
-            |> max(column: "_time")
-            |> yield(name: "max")
-        """
-        result = self.influxdb_query_api.query(query=query)
-        for table in result:
-            for record in table.records:
-                t = record.get_time()
-                if t is not None:
-                    return t
+        for record in self.influxdb_query_api.query_stream(
+            query=self._last_inverter_ts_query
+        ):
+            t = record.get_time()
+            if t is not None:
+                return t
         return None
 
-    def _power_high_rate_points(self, sample_data: SampleData) -> List[Point]:
-        points = []
-        for line_index, line_sample in enumerate(
-            sample_data.total_consumption.eim_line_samples
-        ):
-            p = self._idb_point_from_line("consumption", line_index, line_sample)
-            points.append(p)
-        for line_index, line_sample in enumerate(
-            sample_data.total_production.eim_line_samples
-        ):
-            p = self._idb_point_from_line("production", line_index, line_sample)
-            points.append(p)
-        for line_index, line_sample in enumerate(
-            sample_data.net_consumption.eim_line_samples
-        ):
-            p = self._idb_point_from_line("net", line_index, line_sample)
-            points.append(p)
-        return points
+    def _power_high_rate_points(self, sample_data: SampleData) -> List[str]:
+        eims = (
+            ("consumption", sample_data.total_consumption),
+            ("production", sample_data.total_production),
+            ("net", sample_data.net_consumption),
+        )
+        return [
+            line
+            for mt, eim in eims
+            for i, s in enumerate(eim.eim_line_samples)
+            if (line := self._idb_point_from_line(mt, i, s)) is not None
+        ]
 
     def _inverter_high_rate_points(
         self, inverter_data: Dict[str, InverterSample]
-    ) -> List[Point]:
-        return [self._point_from_inverter(inv) for inv in inverter_data.values()]
+    ) -> List[str]:
+        return [
+            line
+            for inv in inverter_data.values()
+            if (line := self._point_from_inverter(inv)) is not None
+        ]
 
-    def _power_day_rollover(self, ts: datetime) -> None:
+    def _day_rollover(self, ts: Optional[datetime] = None) -> None:
+        """
+        On the first cycle of a new day (from either job), queue the daily summary.
+        ts stamps the summary points; defaults to now.
+        """
         new_date = date.today()
-        if self.power_todays_date == new_date:
+        if self.todays_date == new_date:
             return
-        self.power_todays_date = new_date
-        points = self._compute_power_daily_Wh_points(ts)
-        if points:
-            self.influxdb_write_api.write(
-                bucket=self.config.influxdb_bucket_lr, record=points
-            )
+        self.todays_date = new_date
+        if ts is None:
+            ts = datetime.now(tz=timezone.utc)
+        self._rollover_executor.submit(self._write_daily_summary, ts)
 
-    def _inverter_day_rollover(self) -> None:
-        new_date = date.today()
-        if self.inverter_todays_date == new_date:
-            return
-        self.inverter_todays_date = new_date
-        ts = datetime.now(tz=timezone.utc)
-        points = self._compute_inverter_daily_Wh_points(ts)
-        if points:
-            self.influxdb_write_api.write(
-                bucket=self.config.influxdb_bucket_lr, record=points
+    def _write_daily_summary(self, ts: datetime) -> None:
+        """
+        Runs on the rollover worker: wait for the batched writer to flush, then
+        Flux query + blocking write to bucket_lr.
+        """
+        self._closing.wait(ROLLOVER_FLUSH_DELAY_S)
+        try:
+            points = self._compute_daily_Wh_points(ts)
+            if points:
+                self.influxdb_daily_write_api.write(
+                    bucket=self.config.influxdb_bucket_lr,
+                    record=points,
+                    write_precision=WritePrecision.S,
+                )
+        except Exception as e:
+            LOG.warning(
+                "Daily summary failed (%s): %s",
+                type(e).__name__,
+                e,
             )
 
-    def _compute_power_daily_Wh_points(self, ts: datetime) -> List[Point]:
-        """Flux query for power line series only (exclude inverter); build daily Wh points."""
-        query = f"""
-        from(bucket: "{self.config.influxdb_bucket_hr}")
-            |> range(start: -24h, stop: 0h)
-            |> filter(fn: (r) => r["source"] == "{self.config.source_tag}")
-            |> filter(fn: (r) => r["_field"] == "P")
-            |> filter(fn: (r) => r["measurement-type"] != "inverter")
-            |> integral(unit: 1h)
-            |> keep(columns: ["_value", "line-idx", "measurement-type"])
-            |> yield(name: "total")
+    def _compute_daily_Wh_points(self, ts: datetime) -> List[str]:
         """
-        result = self.influxdb_query_api.query(query=query)
-        points = []
-        for table in result:
-            for record in table.records:
-                measurement_type = record["measurement-type"]
-                idx = record["line-idx"]
-                p = Point(f"{measurement_type}-daily-summary-line{idx}")
-                p.tag("line-idx", idx)
-                p.time(ts, WritePrecision.S)
-                p.tag("source", self.config.source_tag)
-                p.tag("measurement-type", measurement_type)
-                p.tag("interval", "24h")
-                p.field("Wh", record.get_value())
-                points.append(p)
-        return points
-
-    def _compute_inverter_daily_Wh_points(self, ts: datetime) -> List[Point]:
-        """Flux query for inverter series only; build daily Wh points and 0 Wh for unreported."""
-        query = f"""
-        from(bucket: "{self.config.influxdb_bucket_hr}")
-            |> range(start: -24h, stop: 0h)
-            |> filter(fn: (r) => r["source"] == "{self.config.source_tag}")
-            |> filter(fn: (r) => r["_field"] == "P")
-            |> filter(fn: (r) => r["measurement-type"] == "inverter")
-            |> integral(unit: 1h)
-            |> keep(columns: ["_value", "serial", "measurement-type"])
-            |> yield(name: "total")
+        One Flux query for the power line and inverter integrals; build daily Wh
+        points for each, plus 0 Wh for configured inverters that did not report.
+        A None or non-finite integral is skipped like Point would (an inverter
+        then counts as unreported) so one bad series cannot fail the whole write.
         """
-        result = self.influxdb_query_api.query(query=query)
+        ts_s = timestamp_s(ts)
         unreported_inverters = set(self.config.inverters.keys())
         points = []
-        for table in result:
-            for record in table.records:
+        for record in self.influxdb_query_api.query_stream(query=self._daily_query):
+            fields = encode_fields({"Wh": record.get_value()})
+            if not fields:
+                continue
+            measurement_type = record["measurement-type"]
+            if measurement_type == "inverter":
                 serial = record["serial"]
                 unreported_inverters.discard(serial)
-                p = Point(f"inverter-daily-summary-{serial}")
-                p.tag("serial", serial)
-                self.config.apply_tags_to_inverter_point(p, serial)
-                p.time(ts, WritePrecision.S)
-                p.tag("source", self.config.source_tag)
-                p.tag("measurement-type", "inverter")
-                p.tag("interval", "24h")
-                p.field("Wh", record.get_value())
-                points.append(p)
+                key = self._inverter_daily_series_key(serial)
+            else:
+                key = self._power_daily_series_key(measurement_type, record["line-idx"])
+            points.append(f"{key} {fields} {ts_s}")
         for serial in unreported_inverters:
-            p = Point(f"inverter-daily-summary-{serial}")
-            p.tag("serial", serial)
-            self.config.apply_tags_to_inverter_point(p, serial)
-            p.time(ts, WritePrecision.S)
-            p.tag("source", self.config.source_tag)
-            p.tag("measurement-type", "inverter")
-            p.tag("interval", "24h")
-            p.field("Wh", 0.0)
-            points.append(p)
+            key = self._inverter_daily_series_key(serial)
+            points.append(f"{key} Wh={field_value(0.0)} {ts_s}")
         return points
 
-    def _idb_point_from_line(
-        self, measurement_type: str, idx: int, data: PowerSample
-    ) -> Point:
-        p = Point(f"{measurement_type}-line{idx}")
-        p.time(data.ts, WritePrecision.S)
-        p.tag("source", self.config.source_tag)
-        p.tag("measurement-type", measurement_type)
-        p.tag("line-idx", idx)
-
-        p.field("P", data.wNow)
-        p.field("Q", data.reactPwr)
-        p.field("S", data.apprntPwr)
+    def _power_series_key(self, measurement_type: str, idx: int) -> str:
+        key = self._power_series_keys.get((measurement_type, idx))
+        if key is None:
+            key = series_key(
+                f"{measurement_type}-line{idx}",
+                {
+                    "source": self.config.source_tag,
+                    "measurement-type": measurement_type,
+                    "line-idx": idx,
+                },
+            )
+            self._power_series_keys[(measurement_type, idx)] = key
+        return key
 
-        p.field("I_rms", data.rmsCurrent)
-        p.field("V_rms", data.rmsVoltage)
+    def _inverter_series_key(self, serial: str) -> str:
+        key = self._inverter_series_keys.get(serial)
+        if key is None:
+            tags = {
+                "source": self.config.source_tag,
+                "measurement-type": "inverter",
+                "serial": serial,
+            }
+            tags.update(self.config.get_inverter_tags(serial))
+            key = series_key(f"inverter-production-{serial}", tags)
+            self._inverter_series_keys[serial] = key
+        return key
 
-        return p
+    def _power_daily_series_key(self, measurement_type: str, idx: str) -> str:
+        key = self._power_daily_series_keys.get((measurement_type, idx))
+        if key is None:
+            key = series_key(
+                f"{measurement_type}-daily-summary-line{idx}",
+                {
+                    "line-idx": idx,
+                    "source": self.config.source_tag,
+                    "measurement-type": measurement_type,
+                    "interval": "24h",
+                },
+            )
+            self._power_daily_series_keys[(measurement_type, idx)] = key
+        return key
 
-    def _point_from_inverter(self, inverter: InverterSample) -> Point:
-        p = Point(f"inverter-production-{inverter.serial}")
-        p.time(inverter.ts, WritePrecision.S)
-        p.tag("source", self.config.source_tag)
-        p.tag("measurement-type", "inverter")
-        p.tag("serial", inverter.serial)
-        self.config.apply_tags_to_inverter_point(p, inverter.serial)
+    def _inverter_daily_series_key(self, serial: str) -> str:
+        key = self._inverter_daily_series_keys.get(serial)
+        if key is None:
+            # Configured tags cannot override source/measurement-type/interval here
+            tags = {"serial": serial}
+            tags.update(self.config.get_inverter_tags(serial))
+            tags["source"] = self.config.source_tag
+            tags["measurement-type"] = "inverter"
+            tags["interval"] = "24h"
+            key = series_key(f"inverter-daily-summary-{serial}", tags)
+            self._inverter_daily_series_keys[serial] = key
+        return key
 
-        p.field("P", inverter.watts)
+    def _idb_point_from_line(
+        self, measurement_type: str, idx: int, data: PowerSample
+    ) -> Optional[str]:
+        """Line for one power line sample, or None if it has no finite field."""
+        fields = encode_fields(
+            {
+                "I_rms": data.rmsCurrent,
+                "P": data.wNow,
+                "Q": data.reactPwr,
+                "S": data.apprntPwr,
+                "V_rms": data.rmsVoltage,
+            }
+        )
+        if not fields:
+            return None
+        return (
+            f"{self._power_series_key(measurement_type, idx)} {fields} "
+            f"{timestamp_s(data.ts)}"
+        )
 
-        return p
+    def _point_from_inverter(self, inverter: InverterSample) -> Optional[str]:
+        """Line for one inverter sample, or None if watts is missing or non-finite."""
+        fields = encode_fields({"P": inverter.watts})
+        if not fields:
+            return None
+        return (
+            f"{self._inverter_series_key(inverter.serial)} {fields} "
+            f"{timestamp_s(inverter.ts)}"
+        )
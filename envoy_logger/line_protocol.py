@@ -0,0 +1,70 @@
+"""
+Minimal InfluxDB line-protocol encoding for the fixed series this logger writes.
+
+Output matches influxdb_client's Point.to_line_protocol() for the same measurement,
+tags and fields, so existing series keep the same keys and field types.
+"""
+
+import math
+from datetime import datetime
+from typing import Any, Dict, Optional, Union
+
+_ESCAPE_MEASUREMENT = str.maketrans(
+    {",": r"\,", " ": r"\ ", "\n": r"\n", "\t": r"\t", "\r": r"\r"}
+)
+_ESCAPE_KEY = str.maketrans(
+    {",": r"\,", "=": r"\=", " ": r"\ ", "\n": r"\n", "\t": r"\t", "\r": r"\r"}
+)
+
+
+def escape_tag_value(value: Any) -> str:
+    escaped = str(value).translate(_ESCAPE_KEY)
+    if escaped.endswith("\\"):
+        escaped += " "
+    return escaped
+
+
+def series_key(measurement: str, tags: Dict[str, Any]) -> str:
+    """
+    Return the escaped "measurement,tag=value,..." prefix of a line.
+    Tags are emitted in lexical order; None or empty tags are dropped.
+    """
+    parts = [measurement.translate(_ESCAPE_MEASUREMENT)]
+    for key, value in sorted(tags.items()):
+        if value is None:
+            continue
+        k = str(key).translate(_ESCAPE_KEY)
+        v = escape_tag_value(value)
+        if k and v:
+            parts.append(f"{k}={v}")
+    return ",".join(parts)
+
+
+def field_value(value: Union[bool, int, float]) -> str:
+    """Encode a finite numeric field value (ints get the "i" integer suffix)."""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return f"{value}i"
+    s = str(value)
+    if s.endswith(".0"):
+        s = s[:-2]
+    return s
+
+
+def encode_fields(fields: Dict[str, Optional[Union[bool, int, float]]]) -> str:
+    """
+    Return the "key=value,..." field set in lexical key order. Like Point, None and
+    non-finite float fields are skipped; "" means no field is left (drop the line).
+    """
+    parts = []
+    for key, value in sorted(fields.items()):
+        if value is None or (isinstance(value, float) and not math.isfinite(value)):
+            continue
+        parts.append(f"{key.translate(_ESCAPE_KEY)}={field_value(value)}")
+    return ",".join(parts)
+
+
+def timestamp_s(ts: datetime) -> int:
+    """Timestamp in whole seconds; write with WritePrecision.S. ts must be tz-aware."""
+    return int(ts.timestamp())
@@ -9,7 +9,7 @@ from typing import Any, Dict, List, Optional
 LOG = logging.getLogger("model")
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class PowerSample:
     """
     A generic power sample
@@ -77,7 +77,7 @@ class PowerSample:
         return self.wNow / self.apprntPwr
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class SampleData:
     net_consumption: Optional[EIMSample]
     total_consumption: Optional[EIMSample]
@@ -118,7 +118,7 @@ class SampleData:
         return json.dumps(asdict(self), indent=1, default=str)
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class EIMSample:
     """
     "EIM" measurement.
@@ -152,7 +152,7 @@ class EIMSample:
         return json.dumps(asdict(self), indent=1, default=str)
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class InverterSample:
     ts: datetime
     serial: str
@@ -197,9 +197,8 @@ def filter_new_inverter_data(
     if last_sample_timestamp is None:
         return inverter_data
 
-    filtered_inverter_data: Dict[str, InverterSample] = {}
-    for serial, inverter_sample in inverter_data.items():
-        if inverter_sample.ts > last_sample_timestamp:
-            filtered_inverter_data[serial] = inverter_sample
-
-    return filtered_inverter_data
+    return {
+        serial: inverter_sample
+        for serial, inverter_sample in inverter_data.items()
+        if inverter_sample.ts > last_sample_timestamp
+    }
@@ -1,9 +1,10 @@
 import logging
+import sched
 import sys
+import threading
 import time
 from abc import ABC, abstractmethod
-from datetime import datetime, timezone
-from typing import Dict
+from typing import Callable, Dict, List, Tuple
 
 from envoy_logger.envoy import Envoy
 from envoy_logger.model import InverterSample, SampleData
@@ -21,33 +22,76 @@ class SamplingEngine(ABC):
         self.envoy = envoy
         self.interval_seconds = interval_seconds
         self.inverter_interval_seconds = inverter_interval_seconds
-        self.last_inverter_poll: datetime | None = None
+        # time.monotonic() of the last inverter poll, and the deadline for the next
+        self._last_inverter_poll: float | None = None
+        self._next_inverter_poll = 0.0
+        # Set by stop(); the scheduler waits on it so shutdown need not sit out a sleep
+        self._stop_event = threading.Event()
 
     @abstractmethod
     def run(self) -> None:
         pass
 
-    def wait_for_next_cycle(self, interval_seconds: int) -> None:
-        """Sleep until the next aligned boundary for the given interval (seconds)."""
-        now = datetime.now(tz=timezone.utc)
-        remainder = now.timestamp() % interval_seconds
-        if remainder < 0.1:
-            time_to_next = 0.1
+    @property
+    def last_inverter_poll(self) -> float | None:
+        return self._last_inverter_poll
+
+    @last_inverter_poll.setter
+    def last_inverter_poll(self, value: float | None) -> None:
+        self._last_inverter_poll = value
+        if value is None:
+            self._next_inverter_poll = 0.0
         else:
-            time_to_next = interval_seconds - remainder
+            self._next_inverter_poll = value + self.inverter_interval_seconds
+
+    def time_to_next_cycle(self, interval_seconds: int) -> float:
+        """Seconds until the next wall-clock boundary aligned to the given interval."""
+        remainder = time.time() % interval_seconds
+        if remainder < 0.1:
+            return 0.1
+        return interval_seconds - remainder
+
+    def stop(self) -> None:
+        """Make run_aligned() return as soon as the current job (if any) finishes."""
+        self._stop_event.set()
+
+    def run_aligned(self, jobs: List[Tuple[int, Callable[[], None]]]) -> None:
+        """
+        Run each (interval_seconds, job) at every aligned boundary of its interval,
+        all on the calling thread. A job that overruns its boundary resumes on the
+        next one. Returns once stop() is called.
+        """
+
+        def wait(seconds: float) -> None:
+            if self._stop_event.wait(seconds):
+                for event in scheduler.queue:
+                    scheduler.cancel(event)
+
+        scheduler = sched.scheduler(time.monotonic, wait)
+
+        def enter(interval_seconds: int, job: Callable[[], None], delay: float) -> None:
+            def run_and_reschedule() -> None:
+                job()
+                # Target the boundary after the one just run, even if the job
+                # returned within the 0.1s start-up window of time_to_next_cycle().
+                next_delay = interval_seconds - time.time() % interval_seconds
+                if next_delay < 0.1:
+                    next_delay += interval_seconds
+                enter(interval_seconds, job, next_delay)
+
+            scheduler.enter(delay, 0, run_and_reschedule)
+
+        for interval_seconds, job in jobs:
+            enter(interval_seconds, job, self.time_to_next_cycle(interval_seconds))
+
         try:
-            time.sleep(time_to_next)
+            scheduler.run()
         except KeyboardInterrupt:
             print("Exiting with Ctrl-C")
             sys.exit(0)
 
     def _should_poll_inverters(self) -> bool:
-        if self.last_inverter_poll is None:
-            return True
-        elapsed = (
-            datetime.now(tz=timezone.utc) - self.last_inverter_poll
-        ).total_seconds()
-        return elapsed >= self.inverter_interval_seconds
+        return time.monotonic() >= self._next_inverter_poll
 
     def get_power_data(self) -> SampleData:
         return self.envoy.get_power_data()
@@ -1,3 +1,4 @@
+import signal
 import unittest
 from unittest import mock
 
@@ -6,11 +7,33 @@ from envoy_logger import cli
 
 @mock.patch("envoy_logger.enphase_energy.EnphaseEnergy")
 @mock.patch("envoy_logger.cli.InfluxdbSamplingEngine")
+@mock.patch("envoy_logger.cli.signal.signal")
 class TestCli(unittest.TestCase):
-    def test_main_success(self, mock_sampling_loop, mock_enphase_energy):
+    def test_main_success(self, mock_signal, mock_sampling_loop, mock_enphase_energy):
         mock_sampling_loop.run.return_value = None
         cli.main(argv=["--config", "./docs/config.yml"])
 
+    def test_main_exits_on_sigterm(
+        self, mock_signal, mock_sampling_loop, mock_enphase_energy
+    ):
+        cli.main(argv=["--config", "./docs/config.yml"])
+
+        signum, handler = mock_signal.call_args.args
+        self.assertEqual(signum, signal.SIGTERM)
+        with self.assertRaises(SystemExit) as cm:
+            handler(signum, None)
+        self.assertEqual(cm.exception.code, 0)
+        mock_sampling_loop.return_value.stop.assert_not_called()
+
+    def test_main_logs_single_startup_line(
+        self, mock_signal, mock_sampling_loop, mock_enphase_energy
+    ):
+        with self.assertLogs("envoy_logger.cli", level="INFO") as logs:
+            cli.main(argv=["--config", "./docs/config.yml"])
+
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn("config=./docs/config.yml", logs.output[0])
+
 
 if __name__ == "__main__":
     unittest.main()
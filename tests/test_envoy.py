@@ -1,15 +1,21 @@
+import json
 import unittest
+from datetime import datetime
 from unittest import mock
 
 from requests import Response
+from requests.adapters import HTTPAdapter
+from requests.cookies import cookiejar_from_dict
 from tests.sample_data import create_inverter_data, create_sample_data
+from urllib3 import HTTPResponse
+from urllib3.exceptions import ConnectTimeoutError, MaxRetryError, ReadTimeoutError
 
-from envoy_logger.envoy import Envoy
+from envoy_logger.envoy import Envoy, create_session
 from envoy_logger.model import SampleData, parse_inverter_data
 
 
 @mock.patch("envoy_logger.enphase_energy.EnphaseEnergy")
-@mock.patch("requests.get")
+@mock.patch("requests.Session.get")
 @mock.patch("requests.post")
 class TestEnvoy(unittest.TestCase):
     def test_get_session_id(
@@ -94,6 +100,90 @@ class TestEnvoy(unittest.TestCase):
             expected_inverter_data["foobar"].watts,
         )
 
+    def test_session_pools_connections_and_retries_gateway_errors(
+        self, mock_requests_post, mock_requests_get, mock_enphase_energy
+    ):
+        session = create_session()
+        adapter = session.get_adapter("https://envoy.local")
+        self.assertIs(adapter, session.get_adapter("http://envoy.local"))
+        retry = adapter.max_retries
+
+        # 502/503/504 on a GET are retried, up to total=3
+        for status in (502, 503, 504):
+            self.assertTrue(retry.is_retry("GET", status))
+        self.assertFalse(retry.is_retry("GET", 500))
+        for _ in range(3):
+            retry = retry.increment(
+                method="GET", url="/production.json", response=HTTPResponse(status=503)
+            )
+        with self.assertRaises(MaxRetryError):
+            retry.increment(
+                method="GET", url="/production.json", response=HTTPResponse(status=503)
+            )
+
+        # Timeouts are not retried: the first one gives up
+        for error in (
+            ReadTimeoutError(None, "/production.json", "read timed out"),
+            ConnectTimeoutError("connect timed out"),
+        ):
+            with self.subTest(error=type(error).__name__):
+                with self.assertRaises(MaxRetryError):
+                    adapter.max_retries.increment(
+                        method="GET", url="/production.json", error=error
+                    )
+
+
+def _response(payload=None, cookies=None) -> Response:
+    """A real 200 Response, as HTTPAdapter.send would return it."""
+    response = Response()
+    response.status_code = 200
+    response._content = json.dumps(payload).encode() if payload is not None else b""
+    response.cookies = cookiejar_from_dict(cookies or {})
+    return response
+
+
+@mock.patch("envoy_logger.enphase_energy.EnphaseEnergy")
+class TestEnvoySession(unittest.TestCase):
+    def test_session_reused(self, mock_enphase_energy):
+        """Login and both polls go through one session and its pooled adapter."""
+        mock_enphase_energy.get_token.return_value = "foobar"
+        envoy = Envoy(url="https://envoy.local", enphase_energy=mock_enphase_energy)
+        adapter = envoy.session.get_adapter("https://envoy.local")
+
+        with mock.patch.object(
+            HTTPAdapter,
+            "send",
+            autospec=True,
+            side_effect=[
+                _response(cookies={"sessionId": "foobar"}),
+                _response(create_sample_data()),
+                _response([create_inverter_data("inv1")]),
+                _response(create_sample_data()),
+            ],
+        ) as mock_send, mock.patch.object(HTTPAdapter, "__init__") as mock_new_adapter:
+            envoy.get_power_data()
+            envoy.get_inverter_data()
+            envoy.get_power_data()
+
+        self.assertEqual(mock_send.call_count, 4)
+        self.assertTrue(all(c.args[0] is adapter for c in mock_send.call_args_list))
+        mock_new_adapter.assert_not_called()
+
+    def test_envoys_compare_equal_regardless_of_session(self, mock_enphase_energy):
+        """Each Envoy gets its own session, which is left out of __eq__."""
+        ts = datetime.now()
+        envoys = [
+            Envoy(
+                url="https://envoy.local",
+                enphase_energy=mock_enphase_energy,
+                session_id_last_update=ts,
+            )
+            for _ in range(2)
+        ]
+
+        self.assertIsNot(envoys[0].session, envoys[1].session)
+        self.assertEqual(envoys[0], envoys[1])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,19 +1,77 @@
+import contextlib
+import functools
+import math
+import re
 import threading
+import time
 import unittest
 from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Set
 from unittest import mock
 
-import pytest
 import requests
-from influxdb_client.client.flux_table import FluxTable, TableList
+from influxdb_client import WritePrecision
+from influxdb_client.client.flux_table import FluxRecord
+from influxdb_client.client.write_api import SYNCHRONOUS
 from tests.sample_data import (
     create_inverter_data,
     create_production_only_sample_data,
     create_sample_data,
 )
 
-from envoy_logger.influxdb_sampling_engine import InfluxdbSamplingEngine
-from envoy_logger.model import SampleData, parse_inverter_data
+from envoy_logger.influxdb_sampling_engine import (
+    HIGH_RATE_WRITE_OPTIONS,
+    ROLLOVER_FLUSH_DELAY_S,
+    InfluxdbSamplingEngine,
+)
+from envoy_logger.model import (
+    EIMSample,
+    InverterSample,
+    PowerSample,
+    SampleData,
+    parse_inverter_data,
+)
+
+
+@functools.lru_cache(maxsize=None)
+def _sample_data() -> SampleData:
+    """Parsed full sample, built once per session. Shared: treat as read-only."""
+    return SampleData.create(sample_data=create_sample_data())
+
+
+@functools.lru_cache(maxsize=None)
+def _production_only_sample_data() -> SampleData:
+    return SampleData.create(sample_data=create_production_only_sample_data())
+
+
+@functools.lru_cache(maxsize=None)
+def _inverter_data(*serials: str) -> Dict[str, InverterSample]:
+    """Parsed inverter samples for serials, built once per session. Shared: treat as read-only."""
+    return parse_inverter_data([create_inverter_data(serial) for serial in serials])
+
+
+# One Envoy power line reading with every field PowerSample.create reads.
+_POWER_LINE = {
+    "wNow": 250.0,
+    "rmsCurrent": 1.5,
+    "rmsVoltage": 240.0,
+    "reactPwr": 10.0,
+    "apprntPwr": 300.0,
+    "whToday": 0.0,
+    "vahToday": 0.0,
+    "varhLagToday": 0.0,
+    "varhLeadToday": 0.0,
+    "whLifetime": 0.0,
+    "vahLifetime": 0.0,
+    "varhLagLifetime": 0.0,
+    "varhLeadLifetime": 0.0,
+    "whLastSevenDays": 0.0,
+}
+
+
+def _serials(points: List[str]) -> Set[str]:
+    """Serial tag of each inverter line."""
+    return {re.search(r",serial=([^, ]+)", p).group(1) for p in points}
 
 
 def _inverter_payload(serial: str, report_time: datetime, watts: int = 123) -> dict:
@@ -25,738 +83,657 @@ def _inverter_payload(serial: str, report_time: datetime, watts: int = 123) -> d
     }
 
 
-class _LoopDone(BaseException):
-    """Raised to stop the inverter loop after one cycle in tests (not caught by except Exception)."""
-
-
-def _power_daily_flux_records():
-    """Records as returned by Flux for power-only daily query (no inverter)."""
-    from influxdb_client.client.flux_table import FluxRecord
-
-    return [
-        FluxRecord(
-            {}, {"measurement-type": "consumption", "line-idx": 0, "_value": 100.0}
-        ),
-        FluxRecord({}, {"measurement-type": "net", "line-idx": 0, "_value": 50.0}),
-        FluxRecord(
-            {}, {"measurement-type": "production", "line-idx": 0, "_value": 200.0}
-        ),
-    ]
+# Records as returned by Flux for the power-only daily query (no inverter).
+_POWER_DAILY_RECORDS = (
+    FluxRecord({}, {"measurement-type": "consumption", "line-idx": 0, "_value": 100.0}),
+    FluxRecord({}, {"measurement-type": "net", "line-idx": 0, "_value": 50.0}),
+    FluxRecord({}, {"measurement-type": "production", "line-idx": 0, "_value": 200.0}),
+)
 
+# Records as returned by Flux for the inverter daily query.
+_INVERTER_DAILY_RECORDS = (
+    FluxRecord(
+        {}, {"measurement-type": "inverter", "serial": "foobar", "_value": 50.0}
+    ),
+)
 
-def _inverter_daily_flux_records():
-    """Records as returned by Flux for inverter daily query."""
-    from influxdb_client.client.flux_table import FluxRecord
 
-    return [
-        FluxRecord(
-            {}, {"measurement-type": "inverter", "serial": "foobar", "_value": 50.0}
-        ),
-    ]
+def _daily_flux_records():
+    """Power and inverter tables as streamed back by the combined daily query."""
+    return list(_POWER_DAILY_RECORDS + _INVERTER_DAILY_RECORDS)
 
 
-@mock.patch("influxdb_client.client.query_api.QueryApi")
-@mock.patch("envoy_logger.influxdb_sampling_engine.InfluxDBClient")
-@mock.patch("envoy_logger.envoy.Envoy")
-@mock.patch("envoy_logger.config.Config")
 class TestInfluxdbSamplingEngine(unittest.TestCase):
-    def test_power_high_rate_points(
-        self,
-        mock_config,
-        mock_envoy,
-        mock_influxdb_client,
-        mock_query_api,
-    ):
-        mock_config.influxdb_bucket_hr = "foobar_hr"
-        mock_config.influxdb_bucket_lr = "foobar_lr"
-        mock_config.source_tag = "envoy"
-        mock_config.inverters = {}
-        mock_config.polling_interval = 60
-        mock_config.inverter_polling_interval = 300
-
-        test_sample_data = SampleData.create(sample_data=create_sample_data())
-        mock_envoy.get_power_data.return_value = test_sample_data
+    BASE_CONFIG = {
+        "influxdb_bucket_hr": "foobar_hr",
+        "influxdb_bucket_lr": "foobar_lr",
+        "source_tag": "envoy",
+        "inverters": {},
+        "polling_interval": 60,
+        "inverter_polling_interval": 300,
+        "get_inverter_tags.return_value": {},
+    }
 
-        sampling_engine = InfluxdbSamplingEngine(envoy=mock_envoy, config=mock_config)
-        points = sampling_engine._power_high_rate_points(test_sample_data)
+    @classmethod
+    def setUpClass(cls):
+        # Shared by tests that only render points from samples with BASE_CONFIG;
+        # anything asserting on mocks or engine state builds its own in the test.
+        config = mock.MagicMock(**cls.BASE_CONFIG)
+        with mock.patch("envoy_logger.influxdb_sampling_engine.InfluxDBClient"):
+            cls.points_engine = InfluxdbSamplingEngine(
+                envoy=mock.MagicMock(), config=config
+            )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.points_engine.close()
+
+    def setUp(self):
+        stack = contextlib.ExitStack()
+        self.addCleanup(stack.close)
+        # Only the client class is looked up by the engine; Config, Envoy and the
+        # query API are passed in or assigned, so plain mocks stand in for them.
+        self.mock_influxdb_client = stack.enter_context(
+            mock.patch("envoy_logger.influxdb_sampling_engine.InfluxDBClient")
+        )
+        # Rollover tests drain the worker directly; skip its batch flush wait
+        stack.enter_context(
+            mock.patch(
+                "envoy_logger.influxdb_sampling_engine.ROLLOVER_FLUSH_DELAY_S", 0
+            )
+        )
+        self.mock_config = mock.MagicMock(**self.BASE_CONFIG)
+        self.mock_envoy = mock.MagicMock()
+        self.mock_query_api = mock.MagicMock()
+
+    def _written_points(self, write, bucket):
+        """Assert a single second-precision write to bucket and return its lines."""
+        write.assert_called_once()
+        call_kw = write.call_args.kwargs
+        self.assertEqual(call_kw["bucket"], bucket)
+        self.assertEqual(call_kw["write_precision"], WritePrecision.S)
+        return call_kw["record"]
+
+    def _assert_daily_write(self, engine, expected_points):
+        """Assert one bucket_lr write of expected_points lines, or no write when None."""
+        write = engine.influxdb_daily_write_api.write
+        if expected_points is None:
+            write.assert_not_called()
+            return
+        points = self._written_points(write, "foobar_lr")
+        self.assertEqual(len(points), expected_points)
+
+    def test_power_high_rate_points(self):
+        test_sample_data = _sample_data()
+        points = self.points_engine._power_high_rate_points(test_sample_data)
 
         self.assertIsInstance(points, list)
         # consumption + production + net, each with 3 lines = 9 points
         self.assertEqual(len(points), 9)
-        # Assert point shape matches what we write to InfluxDB (tags and field P)
-        first = points[0]
-        self.assertEqual(first._name.split("-")[0], "consumption")
-        self.assertEqual(first._tags["source"], "envoy")
-        self.assertIn(
-            first._tags["measurement-type"], ("consumption", "production", "net")
+        # Assert line shape matches what we write to InfluxDB (tags and field P)
+        series, fields, ts = points[0].split(" ")
+        self.assertEqual(
+            series,
+            "consumption-line0,line-idx=0,measurement-type=consumption,source=envoy",
+        )
+        self.assertIn("P=1.23", fields.split(","))
+        self.assertEqual(
+            int(ts),
+            int(test_sample_data.total_consumption.eim_line_samples[0].ts.timestamp()),
         )
-        self.assertIn("P", first._fields)
 
-    def test_inverter_high_rate_points(
-        self,
-        mock_config,
-        mock_envoy,
-        mock_influxdb_client,
-        mock_query_api,
-    ):
-        mock_config.influxdb_bucket_hr = "foobar_hr"
-        mock_config.influxdb_bucket_lr = "foobar_lr"
-        mock_config.source_tag = "envoy"
-        mock_config.inverters = {}
-        mock_config.polling_interval = 60
-        mock_config.inverter_polling_interval = 300
-        mock_config.apply_tags_to_inverter_point = mock.Mock()
-
-        test_inverter_data = parse_inverter_data([create_inverter_data("inv1")])
-        sampling_engine = InfluxdbSamplingEngine(envoy=mock_envoy, config=mock_config)
-        points = sampling_engine._inverter_high_rate_points(test_inverter_data)
+    def test_power_high_rate_points_skip_non_finite_fields(self):
+        """A NaN/None reading drops that field (like Point); a line with no fields is dropped."""
+        ts = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        good = PowerSample.create(
+            power_data={**_POWER_LINE, "wNow": math.nan, "reactPwr": math.inf}, ts=ts
+        )
+        empty = PowerSample.create(power_data={k: math.nan for k in _POWER_LINE}, ts=ts)
+        sample_data = SampleData(
+            net_consumption=EIMSample([]),
+            total_consumption=EIMSample([good, empty]),
+            total_production=EIMSample([]),
+        )
+
+        points = self.points_engine._power_high_rate_points(sample_data)
 
         self.assertEqual(len(points), 1)
-        self.assertEqual(points[0]._tags["serial"], "inv1")
-        self.assertEqual(points[0]._tags["measurement-type"], "inverter")
-        self.assertEqual(points[0]._fields["P"], 123)
+        _, fields, _ = points[0].split(" ")
+        self.assertEqual(fields, "I_rms=1.5,S=300,V_rms=240")
 
-    def test_compute_power_daily_Wh_points(
-        self,
-        mock_config,
-        mock_envoy,
-        mock_influxdb_client,
-        mock_query_api,
-    ):
-        mock_config.influxdb_bucket_hr = "foobar_hr"
-        mock_config.influxdb_bucket_lr = "foobar_lr"
-        mock_config.source_tag = "envoy"
-        mock_config.inverters = {}
-        mock_config.polling_interval = 60
-        mock_config.inverter_polling_interval = 300
+    def test_inverter_high_rate_points(self):
+        test_inverter_data = _inverter_data("inv1")
+        points = self.points_engine._inverter_high_rate_points(test_inverter_data)
 
-        mock_table = mock.Mock(FluxTable)
-        mock_table.records = _power_daily_flux_records()
-        mock_query_api.query.return_value = TableList([mock_table])
+        self.assertEqual(len(points), 1)
+        series, fields, _ = points[0].split(" ")
+        self.assertEqual(
+            series,
+            "inverter-production-inv1,measurement-type=inverter,serial=inv1,source=envoy",
+        )
+        self.assertEqual(fields, "P=123i")
 
-        sampling_engine = InfluxdbSamplingEngine(envoy=mock_envoy, config=mock_config)
-        sampling_engine.influxdb_query_api = mock_query_api
+    def test_inverter_high_rate_points_include_configured_tags(self):
+        """Tags configured for an inverter are added to its line, in lexical order."""
+        self.mock_config.get_inverter_tags.return_value = {"array": "east roof"}
 
-        ts = datetime.now(tz=timezone.utc)
-        points = sampling_engine._compute_power_daily_Wh_points(ts)
+        test_inverter_data = _inverter_data("inv1")
+        sampling_engine = InfluxdbSamplingEngine(
+            envoy=self.mock_envoy, config=self.mock_config
+        )
+        points = sampling_engine._inverter_high_rate_points(test_inverter_data)
 
-        self.assertEqual(len(points), 3)
-        mock_query_api.query.assert_called_once()
+        self.assertTrue(
+            points[0].startswith(
+                "inverter-production-inv1,array=east\\ roof,measurement-type=inverter,"
+            )
+        )
+        self.mock_config.get_inverter_tags.assert_called_once_with("inv1")
 
-    def test_compute_power_daily_Wh_points_when_flux_returns_empty_returns_empty_list(
-        self,
-        mock_config,
-        mock_envoy,
-        mock_influxdb_client,
-        mock_query_api,
-    ):
-        """When the daily power Flux query returns no rows, we return no points (no write on rollover)."""
-        mock_config.influxdb_bucket_hr = "foobar_hr"
-        mock_config.influxdb_bucket_lr = "foobar_lr"
-        mock_config.source_tag = "envoy"
-        mock_config.inverters = {}
-        mock_config.polling_interval = 60
-        mock_config.inverter_polling_interval = 300
+    def test_configured_inverter_tags_are_resolved_once_at_startup(self):
+        """Series prefixes for configured inverters are built in __init__ and reused."""
+        self.mock_config.configure_mock(inverters={"inv1": {}})
+        self.mock_config.get_inverter_tags.return_value = {"array": "A"}
 
-        mock_query_api.query.return_value = TableList([])
+        sampling_engine = InfluxdbSamplingEngine(
+            envoy=self.mock_envoy, config=self.mock_config
+        )
+        self.assertEqual(self.mock_config.get_inverter_tags.call_count, 2)
 
-        engine = InfluxdbSamplingEngine(envoy=mock_envoy, config=mock_config)
-        engine.influxdb_query_api = mock_query_api
+        test_inverter_data = _inverter_data("inv1")
+        sampling_engine._inverter_high_rate_points(test_inverter_data)
+        sampling_engine._inverter_high_rate_points(test_inverter_data)
 
-        ts = datetime.now(tz=timezone.utc)
-        points = engine._compute_power_daily_Wh_points(ts)
+        self.assertEqual(self.mock_config.get_inverter_tags.call_count, 2)
+        self.assertIn("inv1", sampling_engine._inverter_series_keys)
+        self.assertIn("inv1", sampling_engine._inverter_daily_series_keys)
 
-        self.assertEqual(points, [])
-        mock_query_api.query.assert_called_once()
+    def test_compute_daily_Wh_points(self):
+        """One Flux request returns both tables; records are routed by measurement-type."""
+        self.mock_config.configure_mock(
+            inverters={"foobar": {}, "unreported_serial": {}}
+        )
+        self.mock_query_api.query_stream.return_value = _daily_flux_records()
 
-    def test_compute_inverter_daily_Wh_points(
-        self,
-        mock_config,
-        mock_envoy,
-        mock_influxdb_client,
-        mock_query_api,
-    ):
-        mock_config.influxdb_bucket_hr = "foobar_hr"
-        mock_config.influxdb_bucket_lr = "foobar_lr"
-        mock_config.source_tag = "envoy"
-        mock_config.inverters = {"foobar": {}, "unreported_serial": {}}
-        mock_config.polling_interval = 60
-        mock_config.inverter_polling_interval = 300
-        mock_config.apply_tags_to_inverter_point = mock.Mock()
+        sampling_engine = InfluxdbSamplingEngine(
+            envoy=self.mock_envoy, config=self.mock_config
+        )
+        sampling_engine.influxdb_query_api = self.mock_query_api
 
-        mock_table = mock.Mock(FluxTable)
-        mock_table.records = _inverter_daily_flux_records()
-        mock_query_api.query.return_value = TableList([mock_table])
+        ts = datetime.now(tz=timezone.utc)
+        points = sampling_engine._compute_daily_Wh_points(ts)
+
+        self.mock_query_api.query_stream.assert_called_once()
+        query = self.mock_query_api.query_stream.call_args.kwargs["query"]
+        self.assertIn('from(bucket: "foobar_hr")', query)
+        self.assertIn('r["source"] == "envoy"', query)
+        self.assertIn('yield(name: "power")', query)
+        self.assertIn('yield(name: "inverter")', query)
+        ts_s = int(ts.timestamp())
+        # 3 power lines + foobar from Flux + 0 Wh for unreported_serial
+        self.assertEqual(len(points), 5)
+        self.assertEqual(
+            points[0],
+            "consumption-daily-summary-line0,interval=24h,line-idx=0,"
+            f"measurement-type=consumption,source=envoy Wh=100 {ts_s}",
+        )
+        self.assertEqual(
+            points[3],
+            "inverter-daily-summary-foobar,interval=24h,measurement-type=inverter,"
+            f"serial=foobar,source=envoy Wh=50 {ts_s}",
+        )
+        self.assertTrue(
+            points[4].startswith("inverter-daily-summary-unreported_serial,")
+        )
+        self.assertTrue(points[4].endswith(f" Wh=0 {ts_s}"))
+
+    def test_compute_daily_Wh_points_skips_none_and_nan_integrals(self):
+        """A None/NaN integral is dropped (and a configured inverter gets 0 Wh) instead of failing the write."""
+        self.mock_config.configure_mock(inverters={"foobar": {}})
+        self.mock_query_api.query_stream.return_value = [
+            FluxRecord({}, {"measurement-type": "net", "line-idx": 0, "_value": None}),
+            FluxRecord(
+                {}, {"measurement-type": "production", "line-idx": 0, "_value": 200.0}
+            ),
+            FluxRecord(
+                {},
+                {
+                    "measurement-type": "inverter",
+                    "serial": "foobar",
+                    "_value": math.nan,
+                },
+            ),
+        ]
 
-        sampling_engine = InfluxdbSamplingEngine(envoy=mock_envoy, config=mock_config)
-        sampling_engine.influxdb_query_api = mock_query_api
+        engine = InfluxdbSamplingEngine(envoy=self.mock_envoy, config=self.mock_config)
+        engine.influxdb_query_api = self.mock_query_api
 
         ts = datetime.now(tz=timezone.utc)
-        points = sampling_engine._compute_inverter_daily_Wh_points(ts)
+        points = engine._compute_daily_Wh_points(ts)
 
-        # One from Flux (foobar) + one 0 Wh for unreported_serial
-        self.assertEqual(len(points), 2)
-        mock_query_api.query.assert_called_once()
+        ts_s = int(ts.timestamp())
+        self.assertEqual(
+            points,
+            [
+                "production-daily-summary-line0,interval=24h,line-idx=0,"
+                f"measurement-type=production,source=envoy Wh=200 {ts_s}",
+                "inverter-daily-summary-foobar,interval=24h,measurement-type=inverter,"
+                f"serial=foobar,source=envoy Wh=0 {ts_s}",
+            ],
+        )
 
-    def test_compute_inverter_daily_Wh_points_when_flux_returns_empty_still_returns_zero_wh_for_configured(
+    def test_compute_daily_Wh_points_when_flux_returns_empty_still_returns_zero_wh_for_configured(
         self,
-        mock_config,
-        mock_envoy,
-        mock_influxdb_client,
-        mock_query_api,
     ):
-        """When daily inverter Flux returns no rows, we still emit 0 Wh for each configured inverter."""
-        mock_config.influxdb_bucket_hr = "foobar_hr"
-        mock_config.influxdb_bucket_lr = "foobar_lr"
-        mock_config.source_tag = "envoy"
-        mock_config.inverters = {"inv1": {}, "inv2": {}}
-        mock_config.polling_interval = 60
-        mock_config.inverter_polling_interval = 300
-        mock_config.apply_tags_to_inverter_point = mock.Mock()
+        """When daily Flux returns no rows, we still emit 0 Wh for each configured inverter."""
+        self.mock_config.configure_mock(inverters={"inv1": {}, "inv2": {}})
 
-        mock_query_api.query.return_value = TableList([])
+        self.mock_query_api.query_stream.return_value = []
 
-        engine = InfluxdbSamplingEngine(envoy=mock_envoy, config=mock_config)
-        engine.influxdb_query_api = mock_query_api
+        engine = InfluxdbSamplingEngine(envoy=self.mock_envoy, config=self.mock_config)
+        engine.influxdb_query_api = self.mock_query_api
 
         ts = datetime.now(tz=timezone.utc)
-        points = engine._compute_inverter_daily_Wh_points(ts)
+        points = engine._compute_daily_Wh_points(ts)
 
         self.assertEqual(len(points), 2)
-        serials = {p._tags["serial"] for p in points}
-        self.assertEqual(serials, {"inv1", "inv2"})
-        for p in points:
-            self.assertEqual(p._fields["Wh"], 0.0)
-        mock_query_api.query.assert_called_once()
+        ts_s = int(ts.timestamp())
+        self.assertEqual(
+            sorted(points),
+            [
+                f"inverter-daily-summary-inv1,interval=24h,measurement-type=inverter,"
+                f"serial=inv1,source=envoy Wh=0 {ts_s}",
+                f"inverter-daily-summary-inv2,interval=24h,measurement-type=inverter,"
+                f"serial=inv2,source=envoy Wh=0 {ts_s}",
+            ],
+        )
+        self.mock_query_api.query_stream.assert_called_once()
 
-    def test_compute_inverter_daily_Wh_points_when_flux_empty_and_no_configured_inverters_returns_empty(
+    def test_compute_daily_Wh_points_when_flux_empty_and_no_configured_inverters_returns_empty(
         self,
-        mock_config,
-        mock_envoy,
-        mock_influxdb_client,
-        mock_query_api,
     ):
         """When Flux returns no rows and config.inverters is empty, we return no points."""
-        mock_config.influxdb_bucket_hr = "foobar_hr"
-        mock_config.influxdb_bucket_lr = "foobar_lr"
-        mock_config.source_tag = "envoy"
-        mock_config.inverters = {}
-        mock_config.polling_interval = 60
-        mock_config.inverter_polling_interval = 300
-        mock_config.apply_tags_to_inverter_point = mock.Mock()
-
-        mock_query_api.query.return_value = TableList([])
+        self.mock_query_api.query_stream.return_value = []
 
-        engine = InfluxdbSamplingEngine(envoy=mock_envoy, config=mock_config)
-        engine.influxdb_query_api = mock_query_api
+        engine = InfluxdbSamplingEngine(envoy=self.mock_envoy, config=self.mock_config)
+        engine.influxdb_query_api = self.mock_query_api
 
         ts = datetime.now(tz=timezone.utc)
-        points = engine._compute_inverter_daily_Wh_points(ts)
+        points = engine._compute_daily_Wh_points(ts)
 
         self.assertEqual(points, [])
+        self.mock_query_api.query_stream.assert_called_once()
+
+    def test_day_rollover(self):
+        """Rollover queries Flux only on a new day, and writes to bucket_lr only when there are points."""
+        cases = [
+            # (days since todays_date, configured inverters, Flux records,
+            #  expected queries, expected points)
+            (0, {}, None, 0, None),
+            (1, {"foobar": {}, "unreported": {}}, _daily_flux_records(), 1, 5),
+            (1, {}, [], 1, None),
+        ]
+        for days_behind, inverters, records, expected_queries, expected_points in cases:
+            with self.subTest(days_behind=days_behind, inverters=inverters):
+                self.mock_config.inverters = inverters
+                query_api = mock.Mock()
+                query_api.query_stream.return_value = records
+                engine = InfluxdbSamplingEngine(
+                    envoy=self.mock_envoy, config=self.mock_config
+                )
+                engine.influxdb_query_api = query_api
+                engine.influxdb_daily_write_api = mock.Mock()
+                engine.todays_date = date.today() - timedelta(days=days_behind)
+
+                engine._day_rollover(datetime.now(tz=timezone.utc))
+                engine._rollover_executor.shutdown(wait=True)
+
+                self.assertEqual(query_api.query_stream.call_count, expected_queries)
+                self._assert_daily_write(engine, expected_points)
+
+    def test_day_rollover_runs_once_for_both_cycles(self):
+        """Whichever cycle sees the new day first queues the summary; the other is a no-op."""
+        self.mock_query_api.query_stream.return_value = _daily_flux_records()
+
+        engine = InfluxdbSamplingEngine(envoy=self.mock_envoy, config=self.mock_config)
+        engine.influxdb_query_api = self.mock_query_api
+        engine.todays_date = date.today() - timedelta(days=1)
+
+        engine._day_rollover(datetime.now(tz=timezone.utc))  # power cycle
+        engine._day_rollover()  # inverter cycle
+        engine._rollover_executor.shutdown(wait=True)
+
+        self.mock_query_api.query_stream.assert_called_once()
+        engine.influxdb_daily_write_api.write.assert_called_once()
+
+    def test_cycles_trigger_day_rollover(self):
+        """Both cycles check for a new day; the power cycle stamps it with its sample time."""
+        self.mock_query_api.query_stream.return_value = []
+        self.mock_envoy.get_power_data.return_value = _sample_data()
+        self.mock_envoy.get_inverter_data.return_value = _inverter_data("inv1")
+
+        engine = InfluxdbSamplingEngine(envoy=self.mock_envoy, config=self.mock_config)
+        engine.influxdb_query_api = self.mock_query_api
+        engine._day_rollover = mock.Mock()
+
+        engine._power_cycle()
+        engine._inverter_cycle()
 
-    def test_power_day_rollover_when_same_date_does_not_query_or_write(
-        self,
-        mock_config,
-        mock_envoy,
-        mock_influxdb_client,
-        mock_query_api,
-    ):
-        """When power_todays_date is already today, rollover does nothing (no Flux query, no write)."""
-        mock_config.influxdb_bucket_hr = "foobar_hr"
-        mock_config.influxdb_bucket_lr = "foobar_lr"
-        mock_config.source_tag = "envoy"
-        mock_config.inverters = {}
-        mock_config.polling_interval = 60
-        mock_config.inverter_polling_interval = 300
-
-        engine = InfluxdbSamplingEngine(envoy=mock_envoy, config=mock_config)
-        engine.influxdb_query_api = mock_query_api
-        write_api = engine.influxdb_write_api
-        # power_todays_date is set in __init__ to date.today(), so same day
-        ts = datetime.now(tz=timezone.utc)
-
-        engine._power_day_rollover(ts)
-
-        mock_query_api.query.assert_not_called()
-        write_api.write.assert_not_called()
+        self.assertEqual(
+            engine._day_rollover.call_args_list,
+            [
+                mock.call(_sample_data().total_production.eim_line_samples[0].ts),
+                mock.call(),
+            ],
+        )
 
-    def test_power_day_rollover_when_date_changed_queries_and_writes_to_bucket_lr(
-        self,
-        mock_config,
-        mock_envoy,
-        mock_influxdb_client,
-        mock_query_api,
-    ):
-        """When power_todays_date is in the past, rollover runs Flux query and writes daily points to bucket_lr."""
-        mock_config.influxdb_bucket_hr = "foobar_hr"
-        mock_config.influxdb_bucket_lr = "foobar_lr"
-        mock_config.source_tag = "envoy"
-        mock_config.inverters = {}
-        mock_config.polling_interval = 60
-        mock_config.inverter_polling_interval = 300
-
-        mock_table = mock.Mock(FluxTable)
-        mock_table.records = _power_daily_flux_records()
-        mock_query_api.query.return_value = TableList([mock_table])
-
-        engine = InfluxdbSamplingEngine(envoy=mock_envoy, config=mock_config)
-        engine.influxdb_query_api = mock_query_api
-        engine.influxdb_write_api = (
-            mock_influxdb_client.return_value.write_api.return_value
+    def test_day_rollover_waits_for_batched_writes_before_querying(self):
+        """The Flux integral only runs after the batching writer's flush interval plus jitter."""
+        self.mock_query_api.query_stream.return_value = []
+
+        engine = InfluxdbSamplingEngine(envoy=self.mock_envoy, config=self.mock_config)
+        engine.influxdb_query_api = self.mock_query_api
+        engine.todays_date = date.today() - timedelta(days=1)
+        calls = mock.Mock()
+        calls.attach_mock(mock.Mock(), "wait")
+        calls.attach_mock(self.mock_query_api.query_stream, "query_stream")
+        engine._closing = calls
+
+        with mock.patch(
+            "envoy_logger.influxdb_sampling_engine.ROLLOVER_FLUSH_DELAY_S", 12.0
+        ):
+            engine._day_rollover(datetime.now(tz=timezone.utc))
+            engine._rollover_executor.shutdown(wait=True)
+
+        self.assertEqual([c[0] for c in calls.mock_calls], ["wait", "query_stream"])
+        calls.wait.assert_called_once_with(12.0)
+        self.assertEqual(
+            ROLLOVER_FLUSH_DELAY_S,
+            (
+                HIGH_RATE_WRITE_OPTIONS.flush_interval
+                + HIGH_RATE_WRITE_OPTIONS.jitter_interval
+            )
+            / 1000,
         )
-        engine.power_todays_date = date.today() - timedelta(days=1)
-        ts = datetime.now(tz=timezone.utc)
 
-        engine._power_day_rollover(ts)
+    def test_close_cuts_short_a_pending_rollover_wait(self):
+        """close() flushes the batched writer, then wakes the rollover worker so shutdown is prompt."""
+        self.mock_query_api.query_stream.return_value = []
 
-        mock_query_api.query.assert_called_once()
-        engine.influxdb_write_api.write.assert_called_once()
-        call_kw = engine.influxdb_write_api.write.call_args[1]
-        self.assertEqual(call_kw["bucket"], "foobar_lr")
-        self.assertEqual(len(call_kw["record"]), 3)
+        engine = InfluxdbSamplingEngine(envoy=self.mock_envoy, config=self.mock_config)
+        engine.influxdb_query_api = self.mock_query_api
+        engine.todays_date = date.today() - timedelta(days=1)
 
-    def test_power_day_rollover_when_compute_returns_empty_does_not_write(
-        self,
-        mock_config,
-        mock_envoy,
-        mock_influxdb_client,
-        mock_query_api,
-    ):
-        """When daily Flux returns no rows, compute returns []; rollover must not call write."""
-        mock_config.influxdb_bucket_hr = "foobar_hr"
-        mock_config.influxdb_bucket_lr = "foobar_lr"
-        mock_config.source_tag = "envoy"
-        mock_config.inverters = {}
-        mock_config.polling_interval = 60
-        mock_config.inverter_polling_interval = 300
-
-        mock_query_api.query.return_value = TableList([])
-
-        engine = InfluxdbSamplingEngine(envoy=mock_envoy, config=mock_config)
-        engine.influxdb_query_api = mock_query_api
-        write_api = engine.influxdb_write_api
-        engine.power_todays_date = date.today() - timedelta(days=1)
-        ts = datetime.now(tz=timezone.utc)
+        with mock.patch(
+            "envoy_logger.influxdb_sampling_engine.ROLLOVER_FLUSH_DELAY_S", 60.0
+        ):
+            started = time.monotonic()
+            engine._day_rollover(datetime.now(tz=timezone.utc))
+            engine.close()
 
-        engine._power_day_rollover(ts)
+        self.assertLess(time.monotonic() - started, 5)
+        self.mock_query_api.query_stream.assert_called_once()
+        engine.influxdb_write_api.close.assert_called_once()
 
-        mock_query_api.query.assert_called_once()
-        write_api.write.assert_not_called()
+    def test_day_rollover_runs_off_the_calling_thread_and_logs_failures(self):
+        """The daily summary runs on the rollover worker; a Flux failure is logged, not raised."""
+        threads = []
 
-    def test_inverter_day_rollover_when_same_date_does_not_query_or_write(
-        self,
-        mock_config,
-        mock_envoy,
-        mock_influxdb_client,
-        mock_query_api,
-    ):
-        """When inverter_todays_date is already today, rollover does nothing (no Flux query, no write)."""
-        mock_config.influxdb_bucket_hr = "foobar_hr"
-        mock_config.influxdb_bucket_lr = "foobar_lr"
-        mock_config.source_tag = "envoy"
-        mock_config.inverters = {}
-        mock_config.polling_interval = 60
-        mock_config.inverter_polling_interval = 300
-
-        engine = InfluxdbSamplingEngine(envoy=mock_envoy, config=mock_config)
-        engine.influxdb_query_api = mock_query_api
-        write_api = engine.influxdb_write_api
+        def failing_query(query):
+            threads.append(threading.current_thread().name)
+            raise Exception("Flux query failed")
 
-        engine._inverter_day_rollover()
+        self.mock_query_api.query_stream.side_effect = failing_query
 
-        mock_query_api.query.assert_not_called()
-        write_api.write.assert_not_called()
+        engine = InfluxdbSamplingEngine(envoy=self.mock_envoy, config=self.mock_config)
+        engine.influxdb_query_api = self.mock_query_api
+        engine.todays_date = date.today() - timedelta(days=1)
 
-    def test_inverter_day_rollover_when_date_changed_queries_and_writes_to_bucket_lr(
-        self,
-        mock_config,
-        mock_envoy,
-        mock_influxdb_client,
-        mock_query_api,
-    ):
-        """When inverter_todays_date is in the past, rollover runs Flux query and writes daily points to bucket_lr."""
-        mock_config.influxdb_bucket_hr = "foobar_hr"
-        mock_config.influxdb_bucket_lr = "foobar_lr"
-        mock_config.source_tag = "envoy"
-        mock_config.inverters = {"foobar": {}, "unreported": {}}
-        mock_config.polling_interval = 60
-        mock_config.inverter_polling_interval = 300
-        mock_config.apply_tags_to_inverter_point = mock.Mock()
-
-        mock_table = mock.Mock(FluxTable)
-        mock_table.records = _inverter_daily_flux_records()
-        mock_query_api.query.return_value = TableList([mock_table])
-
-        engine = InfluxdbSamplingEngine(envoy=mock_envoy, config=mock_config)
-        engine.influxdb_query_api = mock_query_api
-        engine.influxdb_write_api = (
-            mock_influxdb_client.return_value.write_api.return_value
-        )
-        engine.inverter_todays_date = date.today() - timedelta(days=1)
+        with self.assertLogs("influxdb_sampling_engine", level="WARNING") as logs:
+            engine._day_rollover(datetime.now(tz=timezone.utc))
+            engine._rollover_executor.shutdown(wait=True)
 
-        engine._inverter_day_rollover()
+        self.assertEqual(len(threads), 1)
+        self.assertTrue(threads[0].startswith("rollover"))
+        self.assertIn("Daily summary failed", logs.output[0])
+        engine.influxdb_daily_write_api.write.assert_not_called()
 
-        mock_query_api.query.assert_called_once()
-        engine.influxdb_write_api.write.assert_called_once()
-        call_kw = engine.influxdb_write_api.write.call_args[1]
-        self.assertEqual(call_kw["bucket"], "foobar_lr")
-        self.assertEqual(len(call_kw["record"]), 2)
+    def test_production_only_power_points(self):
+        """Production-only sample data still produces power points for production lines."""
+        test_sample_data = _production_only_sample_data()
+        points = self.points_engine._power_high_rate_points(test_sample_data)
 
-    def test_inverter_day_rollover_when_compute_returns_empty_does_not_write(
-        self,
-        mock_config,
-        mock_envoy,
-        mock_influxdb_client,
-        mock_query_api,
-    ):
-        """When daily inverter Flux returns no rows and no configured inverters, compute returns []; no write."""
-        mock_config.influxdb_bucket_hr = "foobar_hr"
-        mock_config.influxdb_bucket_lr = "foobar_lr"
-        mock_config.source_tag = "envoy"
-        mock_config.inverters = {}
-        mock_config.polling_interval = 60
-        mock_config.inverter_polling_interval = 300
-        mock_config.apply_tags_to_inverter_point = mock.Mock()
-
-        mock_query_api.query.return_value = TableList([])
-
-        engine = InfluxdbSamplingEngine(envoy=mock_envoy, config=mock_config)
-        engine.influxdb_query_api = mock_query_api
-        write_api = engine.influxdb_write_api
-        engine.inverter_todays_date = date.today() - timedelta(days=1)
+        # Only production has lines (3)
+        self.assertEqual(len(points), 3)
 
-        engine._inverter_day_rollover()
+    def test_run_schedules_power_and_inverter_cycles_on_their_intervals(self):
+        """run() schedules both cycles on one aligned scheduler."""
+        self.mock_config.configure_mock(
+            polling_interval=30, inverter_polling_interval=120
+        )
 
-        mock_query_api.query.assert_called_once()
-        write_api.write.assert_not_called()
+        engine = InfluxdbSamplingEngine(envoy=self.mock_envoy, config=self.mock_config)
+        engine.run_aligned = mock.Mock()
+        engine.run()
 
-    def test_production_only_power_points(
-        self,
-        mock_config,
-        mock_envoy,
-        mock_influxdb_client,
-        mock_query_api,
-    ):
-        """Production-only sample data still produces power points for production lines."""
-        mock_config.influxdb_bucket_hr = "foobar_hr"
-        mock_config.influxdb_bucket_lr = "foobar_lr"
-        mock_config.source_tag = "envoy"
-        mock_config.inverters = {}
-        mock_config.polling_interval = 60
-        mock_config.inverter_polling_interval = 300
-
-        test_sample_data = SampleData.create(
-            sample_data=create_production_only_sample_data()
+        engine.run_aligned.assert_called_once_with(
+            [(30, engine._power_cycle), (120, engine._inverter_cycle)]
         )
-        sampling_engine = InfluxdbSamplingEngine(envoy=mock_envoy, config=mock_config)
-        points = sampling_engine._power_high_rate_points(test_sample_data)
 
-        # Only production has lines (3)
-        self.assertEqual(len(points), 3)
+    def test_run_closes_engine_when_the_loop_exits(self):
+        """run() flushes and closes on any exit, including SystemExit from SIGTERM."""
+        engine = InfluxdbSamplingEngine(envoy=self.mock_envoy, config=self.mock_config)
+        engine.run_aligned = mock.Mock(side_effect=SystemExit(0))
 
-    def test_custom_polling_intervals(
-        self,
-        mock_config,
-        mock_envoy,
-        mock_influxdb_client,
-        mock_query_api,
-    ):
+        with self.assertRaises(SystemExit):
+            engine.run()
+
+        engine.influxdb_write_api.close.assert_called_once()
+        self.mock_influxdb_client.return_value.close.assert_called_once()
+
+    def test_custom_polling_intervals(self):
         """Custom polling intervals from config are used."""
-        mock_config.influxdb_bucket_hr = "foobar_hr"
-        mock_config.influxdb_bucket_lr = "foobar_lr"
-        mock_config.source_tag = "envoy"
-        mock_config.inverters = {}
-        mock_config.polling_interval = 30
-        mock_config.inverter_polling_interval = 120
+        self.mock_config.configure_mock(
+            polling_interval=30, inverter_polling_interval=120
+        )
 
-        sampling_engine = InfluxdbSamplingEngine(envoy=mock_envoy, config=mock_config)
+        sampling_engine = InfluxdbSamplingEngine(
+            envoy=self.mock_envoy, config=self.mock_config
+        )
 
         self.assertEqual(sampling_engine.interval_seconds, 30)
         self.assertEqual(sampling_engine.inverter_interval_seconds, 120)
 
-    @pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
-    def test_power_loop_when_write_raises_skips_cycle_continues(
-        self,
-        mock_config,
-        mock_envoy,
-        mock_influxdb_client,
-        mock_query_api,
-    ):
-        """When write() raises (e.g. InfluxDB down), the power loop catches, skips the cycle, and continues."""
-        mock_config.influxdb_bucket_hr = "foobar_hr"
-        mock_config.influxdb_bucket_lr = "foobar_lr"
-        mock_config.source_tag = "envoy"
-        mock_config.inverters = {}
-        mock_config.polling_interval = 60
-        mock_config.inverter_polling_interval = 300
-
-        test_sample_data = SampleData.create(sample_data=create_sample_data())
-        mock_envoy.get_power_data.return_value = test_sample_data
-        write_api = mock_influxdb_client.return_value.write_api.return_value
-        write_api.write.side_effect = Exception("InfluxDB write failed")
+    def test_high_rate_writes_are_batched_and_daily_writes_are_synchronous(self):
+        """High-rate points go through the batching writer; daily summaries use a blocking writer."""
+        InfluxdbSamplingEngine(envoy=self.mock_envoy, config=self.mock_config)
 
-        engine = InfluxdbSamplingEngine(envoy=mock_envoy, config=mock_config)
-        engine.wait_for_next_cycle = mock.Mock(
-            side_effect=[None, None, _LoopDone("exit after two cycles")]
-        )
+        write_options = [
+            c.kwargs["write_options"]
+            for c in self.mock_influxdb_client.return_value.write_api.call_args_list
+        ]
+        self.assertEqual(write_options, [HIGH_RATE_WRITE_OPTIONS, SYNCHRONOUS])
 
-        thread = threading.Thread(target=engine._power_loop)
-        thread.start()
-        thread.join(timeout=2.0)
-        self.assertFalse(thread.is_alive())
-        self.assertGreaterEqual(write_api.write.call_count, 1)
-        self.assertEqual(write_api.write.call_args[1]["bucket"], "foobar_hr")
+    def test_batched_write_errors_are_logged_from_the_error_callback(self):
+        """Background write failures cannot raise in the poll loop, so the callback logs them."""
+        engine = InfluxdbSamplingEngine(envoy=self.mock_envoy, config=self.mock_config)
 
-    @pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
-    def test_power_loop_when_get_power_data_raises_skips_cycle_no_write(
-        self,
-        mock_config,
-        mock_envoy,
-        mock_influxdb_client,
-        mock_query_api,
-    ):
-        """When get_power_data raises (e.g. Envoy unreachable), the power loop skips the cycle and does not write."""
-        mock_config.influxdb_bucket_hr = "foobar_hr"
-        mock_config.influxdb_bucket_lr = "foobar_lr"
-        mock_config.source_tag = "envoy"
-        mock_config.inverters = {}
-        mock_config.polling_interval = 60
-        mock_config.inverter_polling_interval = 300
-
-        mock_envoy.get_power_data.side_effect = requests.exceptions.ConnectionError(
-            "Envoy unreachable"
+        write_api_kwargs = (
+            self.mock_influxdb_client.return_value.write_api.call_args_list[0].kwargs
+        )
+        self.assertEqual(
+            write_api_kwargs["error_callback"], engine._on_batch_write_error
         )
-        write_api = mock_influxdb_client.return_value.write_api.return_value
 
-        engine = InfluxdbSamplingEngine(envoy=mock_envoy, config=mock_config)
-        engine.wait_for_next_cycle = mock.Mock(
-            side_effect=[None, _LoopDone("exit after one cycle")]
+        with self.assertLogs("influxdb_sampling_engine", level="WARNING") as logs:
+            engine._on_batch_write_error(
+                ("foobar_hr", "org", "s"), "line", ConnectionError("refused")
+            )
+
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(logs.records[0].levelname, "WARNING")
+        self.assertIn("foobar_hr", logs.output[0])
+        self.assertIn("ConnectionError", logs.output[0])
+
+    def test_power_and_inverter_cycles_share_one_write_batch(self):
+        """Both cycles queue into the same batching writer, bucket and precision, so they coalesce."""
+        self.mock_query_api.query_stream.return_value = []
+        self.mock_envoy.get_power_data.return_value = _sample_data()
+        self.mock_envoy.get_inverter_data.return_value = _inverter_data("inv1")
+
+        engine = InfluxdbSamplingEngine(envoy=self.mock_envoy, config=self.mock_config)
+        engine.influxdb_query_api = self.mock_query_api
+        engine.influxdb_write_api = mock.Mock()
+        engine._power_cycle()
+        engine._inverter_cycle()
+
+        batch_keys = {
+            (c.kwargs["bucket"], c.kwargs["write_precision"])
+            for c in engine.influxdb_write_api.write.call_args_list
+        }
+        self.assertEqual(engine.influxdb_write_api.write.call_count, 2)
+        self.assertEqual(batch_keys, {("foobar_hr", WritePrecision.S)})
+
+    def test_close_flushes_batched_writer_and_closes_client(self):
+        """close() flushes queued high-rate points and closes the client."""
+        engine = InfluxdbSamplingEngine(envoy=self.mock_envoy, config=self.mock_config)
+        engine.close()
+
+        engine.influxdb_write_api.close.assert_called_once()
+        self.mock_influxdb_client.return_value.close.assert_called_once()
+
+    def test_power_cycle_when_write_raises_skips_cycle_continues(self):
+        """When write() raises (e.g. InfluxDB down), the power cycle catches and skips; the next cycle still runs."""
+        test_sample_data = _sample_data()
+        self.mock_envoy.get_power_data.return_value = test_sample_data
+        write_api = self.mock_influxdb_client.return_value.write_api.return_value
+        write_api.write.side_effect = Exception("InfluxDB write failed")
+
+        engine = InfluxdbSamplingEngine(envoy=self.mock_envoy, config=self.mock_config)
+        engine._power_cycle()
+        engine._power_cycle()
+
+        # Both cycles attempted a write (it raised) and neither propagated the error.
+        self.assertEqual(write_api.write.call_count, 2)
+        self.assertEqual(write_api.write.call_args[1]["bucket"], "foobar_hr")
+
+    def test_power_cycle_when_get_power_data_raises_skips_cycle_no_write(self):
+        """When get_power_data raises (e.g. Envoy unreachable), the power cycle is skipped and does not write."""
+        self.mock_envoy.get_power_data.side_effect = (
+            requests.exceptions.ConnectionError("Envoy unreachable")
         )
+        write_api = self.mock_influxdb_client.return_value.write_api.return_value
 
-        thread = threading.Thread(target=engine._power_loop)
-        thread.start()
-        thread.join(timeout=2.0)
-        self.assertFalse(thread.is_alive(), "power loop should have exited")
+        engine = InfluxdbSamplingEngine(envoy=self.mock_envoy, config=self.mock_config)
+        engine._power_cycle()
 
         write_api.write.assert_not_called()
 
-    @pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
-    def test_inverter_loop_when_get_inverter_data_raises_skips_cycle_no_write(
-        self,
-        mock_config,
-        mock_envoy,
-        mock_influxdb_client,
-        mock_query_api,
-    ):
-        """When get_inverter_data raises (e.g. Envoy unreachable), inverter loop skips cycle and does not write."""
-        mock_config.influxdb_bucket_hr = "foobar_hr"
-        mock_config.influxdb_bucket_lr = "foobar_lr"
-        mock_config.source_tag = "envoy"
-        mock_config.inverters = {}
-        mock_config.polling_interval = 60
-        mock_config.inverter_polling_interval = 300
-        mock_config.apply_tags_to_inverter_point = mock.Mock()
-
-        mock_query_api.query.return_value = TableList([])
-        mock_envoy.get_inverter_data.side_effect = requests.exceptions.Timeout(
+    def test_inverter_cycle_when_get_inverter_data_raises_skips_cycle_no_write(self):
+        """When get_inverter_data raises (e.g. Envoy unreachable), the inverter cycle is skipped and does not write."""
+        self.mock_query_api.query_stream.return_value = []
+        self.mock_envoy.get_inverter_data.side_effect = requests.exceptions.Timeout(
             "Envoy timeout"
         )
-        write_api = mock_influxdb_client.return_value.write_api.return_value
+        write_api = self.mock_influxdb_client.return_value.write_api.return_value
 
-        engine = InfluxdbSamplingEngine(envoy=mock_envoy, config=mock_config)
-        engine.influxdb_query_api = mock_query_api
-        engine.wait_for_next_cycle = mock.Mock(
-            side_effect=[None, _LoopDone("exit after one cycle")]
-        )
-
-        thread = threading.Thread(target=engine._inverter_loop)
-        thread.start()
-        thread.join(timeout=2.0)
-        self.assertFalse(thread.is_alive(), "inverter loop should have exited")
+        engine = InfluxdbSamplingEngine(envoy=self.mock_envoy, config=self.mock_config)
+        engine.influxdb_query_api = self.mock_query_api
+        engine._inverter_cycle()
 
         write_api.write.assert_not_called()
 
-    @pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
-    def test_inverter_loop_when_write_raises_skips_cycle_continues(
-        self,
-        mock_config,
-        mock_envoy,
-        mock_influxdb_client,
-        mock_query_api,
-    ):
-        """When write() raises (e.g. InfluxDB down), the inverter loop catches, skips the cycle, and continues."""
-        mock_config.influxdb_bucket_hr = "foobar_hr"
-        mock_config.influxdb_bucket_lr = "foobar_lr"
-        mock_config.source_tag = "envoy"
-        mock_config.inverters = {}
-        mock_config.polling_interval = 60
-        mock_config.inverter_polling_interval = 300
-        mock_config.apply_tags_to_inverter_point = mock.Mock()
-
-        mock_query_api.query.return_value = TableList([])
-        mock_envoy.get_inverter_data.return_value = parse_inverter_data(
-            [create_inverter_data("inv1")]
-        )
-        write_api = mock_influxdb_client.return_value.write_api.return_value
+    def test_inverter_cycle_when_write_raises_skips_cycle_continues(self):
+        """When write() raises (e.g. InfluxDB down), the inverter cycle catches and skips; the next cycle still runs."""
+        self.mock_query_api.query_stream.return_value = []
+        self.mock_envoy.get_inverter_data.return_value = _inverter_data("inv1")
+        write_api = self.mock_influxdb_client.return_value.write_api.return_value
         write_api.write.side_effect = Exception("InfluxDB write failed")
 
-        engine = InfluxdbSamplingEngine(envoy=mock_envoy, config=mock_config)
-        engine.influxdb_query_api = mock_query_api
-        engine.wait_for_next_cycle = mock.Mock(
-            side_effect=[None, None, _LoopDone("exit after two cycles")]
-        )
+        engine = InfluxdbSamplingEngine(envoy=self.mock_envoy, config=self.mock_config)
+        engine.influxdb_query_api = self.mock_query_api
+        engine._inverter_cycle()
+        engine._inverter_cycle()
 
-        thread = threading.Thread(target=engine._inverter_loop)
-        thread.start()
-        thread.join(timeout=2.0)
-        self.assertFalse(thread.is_alive())
-        # At least one cycle attempted a write (it raised); loop continued and exited on _LoopDone.
-        self.assertGreaterEqual(write_api.write.call_count, 1)
+        # Both cycles attempted a write (it raised) and neither propagated the error.
+        self.assertEqual(write_api.write.call_count, 2)
         self.assertEqual(write_api.write.call_args[1]["bucket"], "foobar_hr")
 
-    @pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
-    def test_inverter_loop_when_flux_query_raises_writes_nothing(
-        self,
-        mock_config,
-        mock_envoy,
-        mock_influxdb_client,
-        mock_query_api,
-    ):
+    def test_inverter_cycle_when_flux_query_raises_writes_nothing(self):
         """When the Flux query for last inverter timestamp raises, the cycle is skipped and no dupes are written."""
-        mock_config.influxdb_bucket_hr = "foobar_hr"
-        mock_config.influxdb_bucket_lr = "foobar_lr"
-        mock_config.source_tag = "envoy"
-        mock_config.inverters = {}
-        mock_config.polling_interval = 60
-        mock_config.inverter_polling_interval = 300
-        mock_config.apply_tags_to_inverter_point = mock.Mock()
-
-        mock_query_api.query.side_effect = Exception("Flux query failed")
-        mock_envoy.get_inverter_data.return_value = parse_inverter_data(
-            [create_inverter_data("inv1")]
-        )
+        self.mock_query_api.query_stream.side_effect = Exception("Flux query failed")
+        self.mock_envoy.get_inverter_data.return_value = _inverter_data("inv1")
 
-        engine = InfluxdbSamplingEngine(envoy=mock_envoy, config=mock_config)
-        engine.influxdb_query_api = mock_query_api
+        engine = InfluxdbSamplingEngine(envoy=self.mock_envoy, config=self.mock_config)
+        engine.influxdb_query_api = self.mock_query_api
         write_api = engine.influxdb_write_api
 
-        # First call returns (run one cycle); second call raises to exit the loop
-        engine.wait_for_next_cycle = mock.Mock(
-            side_effect=[None, _LoopDone("exit after one cycle")]
-        )
-
-        thread = threading.Thread(target=engine._inverter_loop)
-        thread.start()
-        thread.join(timeout=2.0)
-        self.assertFalse(thread.is_alive(), "inverter loop should have exited")
+        engine._inverter_cycle()
 
         write_api.write.assert_not_called()
 
-    @pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
-    def test_inverter_loop_when_flux_query_returns_cutoff_filters_and_writes_only_new(
+    def test_inverter_cycle_when_flux_query_returns_cutoff_filters_and_writes_only_new(
         self,
-        mock_config,
-        mock_envoy,
-        mock_influxdb_client,
-        mock_query_api,
     ):
         """When the Flux query returns a cutoff timestamp, only inverter data newer than cutoff is written."""
-        mock_config.influxdb_bucket_hr = "foobar_hr"
-        mock_config.influxdb_bucket_lr = "foobar_lr"
-        mock_config.source_tag = "envoy"
-        mock_config.inverters = {}
-        mock_config.polling_interval = 60
-        mock_config.inverter_polling_interval = 300
-        mock_config.apply_tags_to_inverter_point = mock.Mock()
-
         cutoff = datetime.now(tz=timezone.utc) - timedelta(hours=1)
         # One inverter before cutoff, one after; only the one after should be written
         raw_inverters = [
             _inverter_payload("inv_old", cutoff - timedelta(minutes=1)),
             _inverter_payload("inv_new", cutoff + timedelta(minutes=1)),
         ]
-        mock_envoy.get_inverter_data.return_value = parse_inverter_data(raw_inverters)
+        self.mock_envoy.get_inverter_data.return_value = parse_inverter_data(
+            raw_inverters
+        )
 
-        # Query returns the cutoff so filter keeps only inv_new; second call is day-rollover Flux
+        # Query returns the cutoff so filter keeps only inv_new
         mock_record = mock.Mock()
         mock_record.get_time.return_value = cutoff
-        mock_table = mock.Mock(FluxTable)
-        mock_table.records = [mock_record]
-        mock_query_api.query.side_effect = [
-            TableList([mock_table]),
-            TableList([]),  # day-rollover query returns no rows
-        ]
+        self.mock_query_api.query_stream.return_value = [mock_record]
 
-        engine = InfluxdbSamplingEngine(envoy=mock_envoy, config=mock_config)
-        engine.influxdb_query_api = mock_query_api
+        engine = InfluxdbSamplingEngine(envoy=self.mock_envoy, config=self.mock_config)
+        engine.influxdb_query_api = self.mock_query_api
         write_api = engine.influxdb_write_api
-        engine.wait_for_next_cycle = mock.Mock(
-            side_effect=[None, _LoopDone("exit after one cycle")]
-        )
+        engine._inverter_cycle()
 
-        thread = threading.Thread(target=engine._inverter_loop)
-        thread.start()
-        thread.join(timeout=2.0)
-        self.assertFalse(thread.is_alive(), "inverter loop should have exited")
+        points = self._written_points(write_api.write, "foobar_hr")
+        # Only inv_new is newer than the cutoff (filter applied correctly)
+        self.assertEqual(_serials(points), {"inv_new"})
+        self.assertTrue(points[0].startswith("inverter-production-inv_new,"))
 
-        write_api.write.assert_called_once()
-        call_kw = write_api.write.call_args[1]
-        self.assertIn("record", call_kw)
-        points = call_kw["record"]
-        self.assertEqual(
-            len(points), 1, "only the inverter newer than cutoff should be written"
-        )
-        self.assertEqual(call_kw["bucket"], "foobar_hr")
-        # Assert the written point is inv_new, not inv_old (filter applied correctly)
-        self.assertEqual(points[0]._tags["serial"], "inv_new")
-        self.assertEqual(points[0]._name, "inverter-production-inv_new")
-
-    @pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
-    def test_inverter_loop_when_flux_query_returns_empty_writes_all_inverters(
-        self,
-        mock_config,
-        mock_envoy,
-        mock_influxdb_client,
-        mock_query_api,
-    ):
+    def test_inverter_cycle_when_flux_query_returns_empty_writes_all_inverters(self):
         """When the Flux query returns no rows (e.g. first run), no filter is applied; all inverter data is written."""
-        mock_config.influxdb_bucket_hr = "foobar_hr"
-        mock_config.influxdb_bucket_lr = "foobar_lr"
-        mock_config.source_tag = "envoy"
-        mock_config.inverters = {}
-        mock_config.polling_interval = 60
-        mock_config.inverter_polling_interval = 300
-        mock_config.apply_tags_to_inverter_point = mock.Mock()
-
-        mock_query_api.query.return_value = TableList([])
-        mock_envoy.get_inverter_data.return_value = parse_inverter_data(
-            [
-                create_inverter_data("inv1"),
-                create_inverter_data("inv2"),
-            ]
-        )
+        self.mock_query_api.query_stream.return_value = []
+        self.mock_envoy.get_inverter_data.return_value = _inverter_data("inv1", "inv2")
 
-        engine = InfluxdbSamplingEngine(envoy=mock_envoy, config=mock_config)
-        engine.influxdb_query_api = mock_query_api
+        engine = InfluxdbSamplingEngine(envoy=self.mock_envoy, config=self.mock_config)
+        engine.influxdb_query_api = self.mock_query_api
         write_api = engine.influxdb_write_api
-        engine.wait_for_next_cycle = mock.Mock(
-            side_effect=[None, _LoopDone("exit after one cycle")]
-        )
+        engine._inverter_cycle()
+
+        points = self._written_points(write_api.write, "foobar_hr")
+        # All inverters are written when the query returns nothing
+        self.assertEqual(_serials(points), {"inv1", "inv2"})
+        self.assertLessEqual(engine.last_inverter_poll, time.monotonic())
 
-        thread = threading.Thread(target=engine._inverter_loop)
-        thread.start()
-        thread.join(timeout=2.0)
-        self.assertFalse(thread.is_alive(), "inverter loop should have exited")
+    def test_inverter_cycle_queries_last_timestamp_once_and_caches_it(self):
+        """The last-inverter-timestamp Flux query runs once; later cycles filter against the cached value."""
+        self.mock_query_api.query_stream.return_value = []
+        # Same report on both cycles: only the first one is new
+        self.mock_envoy.get_inverter_data.return_value = _inverter_data("inv1")
+
+        engine = InfluxdbSamplingEngine(envoy=self.mock_envoy, config=self.mock_config)
+        engine.influxdb_query_api = self.mock_query_api
+        write_api = engine.influxdb_write_api
+        engine._inverter_cycle()
+        engine._inverter_cycle()
 
+        self.mock_query_api.query_stream.assert_called_once()
         write_api.write.assert_called_once()
-        call_kw = write_api.write.call_args[1]
-        self.assertIn("record", call_kw)
-        points = call_kw["record"]
         self.assertEqual(
-            len(points), 2, "all inverters should be written when query returns nothing"
+            engine._last_inverter_write_ts,
+            self.mock_envoy.get_inverter_data.return_value["inv1"].ts,
         )
-        self.assertEqual(call_kw["bucket"], "foobar_hr")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,61 @@
+import math
+import unittest
+from datetime import datetime, timezone
+
+from influxdb_client import Point, WritePrecision
+
+from envoy_logger.line_protocol import (
+    encode_fields,
+    field_value,
+    series_key,
+    timestamp_s,
+)
+
+
+class TestLineProtocol(unittest.TestCase):
+    def test_series_key_sorts_tags_and_escapes(self):
+        key = series_key(
+            "inverter production",
+            {"source": "envoy", "array": "east,roof", "a=b": "c", "empty": None},
+        )
+        self.assertEqual(
+            key, "inverter\\ production,a\\=b=c,array=east\\,roof,source=envoy"
+        )
+
+    def test_field_value_matches_point_types(self):
+        self.assertEqual(field_value(1.23), "1.23")
+        self.assertEqual(field_value(5.0), "5")
+        self.assertEqual(field_value(123), "123i")
+        self.assertEqual(field_value(True), "true")
+
+    def test_line_matches_point_to_line_protocol(self):
+        ts = datetime(2024, 1, 1, 12, 30, 15, 987654, tzinfo=timezone.utc)
+        tags = {"source": "envoy", "measurement-type": "net", "line-idx": 1}
+        cases = [
+            {"P": -12.5, "I_rms": 3},
+            # Point skips None and non-finite fields...
+            {"P": math.nan, "Q": 1.0},
+            {"P": math.inf, "Q": -math.inf, "S": None, "V_rms": 240.5},
+            # ...and renders no line if none is left
+            {"P": math.nan, "Q": None},
+        ]
+        for fields in cases:
+            with self.subTest(fields=fields):
+                p = Point("net-line1")
+                p.time(ts, WritePrecision.S)
+                for k, v in tags.items():
+                    p.tag(k, v)
+                for k, v in fields.items():
+                    p.field(k, v)
+
+                encoded = encode_fields(fields)
+                line = (
+                    f"{series_key('net-line1', tags)} {encoded} {timestamp_s(ts)}"
+                    if encoded
+                    else ""
+                )
+                self.assertEqual(line, p.to_line_protocol())
+
+
+if __name__ == "__main__":
+    unittest.main()
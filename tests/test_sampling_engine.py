@@ -1,5 +1,5 @@
+import time
 import unittest
-from datetime import datetime, timedelta, timezone
 from unittest import mock
 
 from envoy_logger.model import InverterSample, SampleData
@@ -43,18 +43,26 @@ class TestSamplingEngine(unittest.TestCase):
         sampling_engine = SamplingEngineChildClass(
             envoy=mock_envoy, inverter_interval_seconds=300
         )
-        sampling_engine.last_inverter_poll = datetime.now(tz=timezone.utc)
+        sampling_engine.last_inverter_poll = time.monotonic()
         self.assertFalse(sampling_engine._should_poll_inverters())
 
     def test_should_poll_inverters_true_when_interval_elapsed(self, mock_envoy):
         sampling_engine = SamplingEngineChildClass(
             envoy=mock_envoy, inverter_interval_seconds=300
         )
-        sampling_engine.last_inverter_poll = datetime.now(tz=timezone.utc) - timedelta(
-            seconds=301
-        )
+        sampling_engine.last_inverter_poll = time.monotonic() - 301
         self.assertTrue(sampling_engine._should_poll_inverters())
 
+    def test_should_poll_inverters_at_monotonic_deadline(self, mock_envoy):
+        sampling_engine = SamplingEngineChildClass(
+            envoy=mock_envoy, inverter_interval_seconds=300
+        )
+        sampling_engine.last_inverter_poll = 1000.0
+        with mock.patch("time.monotonic", return_value=1299.9):
+            self.assertFalse(sampling_engine._should_poll_inverters())
+        with mock.patch("time.monotonic", return_value=1300.0):
+            self.assertTrue(sampling_engine._should_poll_inverters())
+
     def test_default_intervals(self, mock_envoy):
         sampling_engine = SamplingEngineChildClass(envoy=mock_envoy)
         self.assertEqual(sampling_engine.interval_seconds, 60)
@@ -67,47 +75,88 @@ class TestSamplingEngine(unittest.TestCase):
         self.assertEqual(sampling_engine.interval_seconds, 30)
         self.assertEqual(sampling_engine.inverter_interval_seconds, 120)
 
-    def test_wait_for_next_cycle_boundary_case(self, mock_envoy):
-        """wait_for_next_cycle(interval) sleeps ~0.1s when now is on boundary."""
-        from unittest.mock import MagicMock, patch
-
+    def test_time_to_next_cycle_boundary_case(self, mock_envoy):
+        """time_to_next_cycle(interval) is ~0.1s when now is on boundary."""
         sampling_engine = SamplingEngineChildClass(
             envoy=mock_envoy, interval_seconds=60
         )
 
-        with patch("envoy_logger.sampling_engine.datetime") as mock_datetime:
-            mock_now = MagicMock()
-            mock_now.timestamp.return_value = 1704067200.0  # divisible by 60
-            mock_datetime.now.return_value = mock_now
-
-            with patch("time.sleep") as mock_sleep:
-                sampling_engine.wait_for_next_cycle(60)
-                mock_sleep.assert_called_once()
-                call_args = mock_sleep.call_args[0][0]
-                self.assertLess(
-                    call_args, 1.0, "Should wait < 1s on boundary, not full interval"
-                )
+        with mock.patch("time.time", return_value=1704067200.0):  # divisible by 60
+            delay = sampling_engine.time_to_next_cycle(60)
 
-    def test_wait_for_next_cycle_normal_case(self, mock_envoy):
-        """wait_for_next_cycle(interval) sleeps until next boundary."""
-        from unittest.mock import MagicMock, patch
+        self.assertLess(delay, 1.0, "Should wait < 1s on boundary, not full interval")
 
+    def test_time_to_next_cycle_normal_case(self, mock_envoy):
+        """time_to_next_cycle(interval) is the time left until the next boundary."""
         sampling_engine = SamplingEngineChildClass(
             envoy=mock_envoy, interval_seconds=60
         )
 
-        with patch("envoy_logger.sampling_engine.datetime") as mock_datetime:
-            base_timestamp = 1704067200.0
-            mock_now = MagicMock()
-            mock_now.timestamp.return_value = base_timestamp + 30.0
-            mock_datetime.now.return_value = mock_now
-
-            with patch("time.sleep") as mock_sleep:
-                sampling_engine.wait_for_next_cycle(60)
-                mock_sleep.assert_called_once()
-                call_args = mock_sleep.call_args[0][0]
-                self.assertGreaterEqual(call_args, 29.0)
-                self.assertLessEqual(call_args, 31.0)
+        with mock.patch("time.time", return_value=1704067200.0 + 30.0):
+            delay = sampling_engine.time_to_next_cycle(60)
+
+        self.assertGreaterEqual(delay, 29.0)
+        self.assertLessEqual(delay, 31.0)
+
+    def test_run_aligned_runs_jobs_on_one_thread_at_their_intervals(self, mock_envoy):
+        """Each job re-runs at every aligned boundary of its own interval."""
+        sampling_engine = SamplingEngineChildClass(envoy=mock_envoy)
+        base = 1704067200.0  # divisible by 60 and 300
+        clock = [base + 10.0]
+        calls = []
+
+        def fake_wait(seconds):
+            clock[0] += seconds
+            return False
+
+        def job(name):
+            def _job():
+                calls.append((round(clock[0] - base), name))
+                if len(calls) == 7:
+                    raise _RunDone()
+
+            return _job
+
+        with mock.patch("time.time", side_effect=lambda: clock[0]), mock.patch(
+            "time.monotonic", side_effect=lambda: clock[0]
+        ), mock.patch.object(
+            sampling_engine._stop_event, "wait", side_effect=fake_wait
+        ):
+            with self.assertRaises(_RunDone):
+                sampling_engine.run_aligned([(60, job("power")), (300, job("inv"))])
+
+        self.assertEqual(
+            sorted(calls),
+            [
+                (60, "power"),
+                (120, "power"),
+                (180, "power"),
+                (240, "power"),
+                (300, "inv"),
+                (300, "power"),
+                (360, "power"),
+            ],
+        )
+
+    def test_stop_ends_run_aligned_without_waiting_out_the_interval(self, mock_envoy):
+        """stop() from a job makes run_aligned return; no further jobs run."""
+        sampling_engine = SamplingEngineChildClass(envoy=mock_envoy)
+        calls = []
+
+        def job():
+            calls.append(time.monotonic())
+            sampling_engine.stop()
+
+        with mock.patch.object(sampling_engine, "time_to_next_cycle", return_value=0):
+            start = time.monotonic()
+            sampling_engine.run_aligned([(3600, job), (3600, job)])
+
+        self.assertEqual(len(calls), 1)
+        self.assertLess(time.monotonic() - start, 5)
+
+
+class _RunDone(BaseException):
+    """Raised by a test job to stop run_aligned (not caught as Exception)."""
 
 
 if __name__ == "__main__":